@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+from ingestion import CATEGORICAL_COLUMNS, DATE_COLUMN, NUMERIC_COLUMNS
+
+# ===================== CUBE LAYOUT =====================
+DAY = 'Day'
+ROWS = 'Rows'
+
+
+def sum_column(col):
+    return f"{col} sum"
+
+
+def count_column(col):
+    return f"{col} count"
+
+
+# ===================== CUBE BUILD =====================
+def build_cube(df):
+    # One cell per (filter dimensions, calendar day) holding the sum and non-null
+    # count of every measure plus the row count. Day rather than month keeps the
+    # date_input range exact; coarser periods are re-aggregated from days.
+    keys = {col: df[col] for col in CATEGORICAL_COLUMNS if col in df.columns}
+    if DATE_COLUMN in df.columns:
+        keys[DAY] = df[DATE_COLUMN].dt.normalize()
+    measures = [col for col in NUMERIC_COLUMNS if col in df.columns]
+
+    work = pd.DataFrame(keys, index=df.index)
+    for col in measures:
+        # Sums accumulate in float64 even when the working frame stores float32
+        work[col] = df[col].astype('float64') if df[col].dtype.kind == 'f' else df[col]
+
+    if not keys:
+        cube = pd.DataFrame({ROWS: [len(work)]})
+        for col in measures:
+            cube[sum_column(col)] = work[col].sum()
+            cube[count_column(col)] = work[col].count()
+        return cube
+
+    grouped = work.groupby(list(keys), observed=True, dropna=False, sort=False)
+    cube = pd.DataFrame({ROWS: grouped.size()})
+    for col in measures:
+        cube[sum_column(col)] = grouped[col].sum()
+        cube[count_column(col)] = grouped[col].count()
+    return cube.reset_index()
+
+
+def merge_cubes(cubes):
+    # Sums the cells of several cubes that share a dimension key, so a dataset
+    # grown by one file only needs that file's cube merged into the existing one.
+    # Dimensions or measures a file lacks count as missing values / zero.
+    if len(cubes) == 1:
+        return cubes[0]
+    cells = pd.concat(cubes, ignore_index=True)
+    keys = [col for col in CATEGORICAL_COLUMNS + [DAY] if col in cells.columns]
+    for col in keys:
+        if col != DAY:
+            cells[col] = cells[col].astype('category')
+    measures = [col for col in cells.columns if col not in keys]
+    cells[measures] = cells[measures].fillna(0)
+
+    if not keys:
+        merged = cells[measures].sum().to_frame().T
+    else:
+        merged = cells.groupby(keys, observed=True, dropna=False, sort=False)[measures].sum().reset_index()
+    counts = [col for col in measures if col == ROWS or col.endswith(' count')]
+    merged[counts] = merged[counts].astype('int64')
+    return merged
+
+
+# ===================== TIME ROLLUPS =====================
+# Integer period keys derived from a DatetimeIndex of days without NaT:
+#   Day     days since 1970-01-01
+#   Week    weeks since the Monday before 1970-01-01 (weeks start on Monday)
+#   Month   year * 12 + month - 1
+#   Quarter month code // 3, i.e. year * 4 + quarter - 1
+GRANULARITIES = ['Day', 'Week', 'Month', 'Quarter']
+DEFAULT_GRANULARITY = 'Month'
+PERIOD = 'Period'
+
+
+def day_codes(days):
+    return days.to_numpy(dtype='datetime64[D]').astype('int64')
+
+
+def month_codes(days):
+    return (days.year * 12 + days.month - 1).to_numpy(dtype='int64')
+
+
+def period_codes(days, granularity):
+    if granularity == 'Day':
+        return day_codes(days)
+    if granularity == 'Week':
+        # 1970-01-01 was a Thursday
+        return (day_codes(days) + 3) // 7
+    if granularity == 'Month':
+        return month_codes(days)
+    if granularity == 'Quarter':
+        return month_codes(days) // 3
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def period_label(code, granularity):
+    if granularity == 'Day':
+        return str(np.datetime64(code, 'D'))
+    if granularity == 'Week':
+        return str(np.datetime64(code * 7 - 3, 'D'))
+    if granularity == 'Month':
+        return f"{code // 12:04d}-{code % 12 + 1:02d}"
+    return f"{code // 4:04d}-Q{code % 4 + 1}"
+
+
+def rollup(daily, granularity):
+    # Re-aggregates a per-day frame (DatetimeIndex) to the granularity's period
+    # codes: one pass over the days, independent of the number of rows
+    if granularity == 'Day':
+        rolled = daily.copy()
+        rolled.index = day_codes(daily.index)
+    else:
+        rolled = daily.groupby(period_codes(daily.index, granularity)).sum()
+    rolled.index.name = PERIOD
+    return rolled
+
+
+# ===================== CUBE QUERIES =====================
+def slice_cube(cube, filters):
+    mask = np.ones(len(cube), dtype=bool)
+    for col, val in filters.items():
+        if col == DATE_COLUMN and isinstance(val, tuple) and len(val) == 2:
+            if DAY in cube.columns:
+                start, end = pd.to_datetime(val[0]), pd.to_datetime(val[1])
+                mask &= ((cube[DAY] >= start) & (cube[DAY] <= end)).to_numpy()
+        elif isinstance(val, list) and val and col in cube.columns:
+            mask &= cube[col].isin(val).to_numpy()
+    return cube[mask]
+
+
+# ===================== AGGREGATION PLANNER =====================
+# Every (dimension, measure, reducer) the page shows. A None dimension is a grand
+# total, a None measure with 'count' counts rows.
+DASHBOARD_REQUESTS = [
+    # KPIs
+    (None, 'Total', 'sum'),
+    (None, 'Quantity', 'sum'),
+    (None, 'Tax 5%', 'sum'),
+    (None, 'Rating', 'mean'),
+    # Rows left by the filters
+    (None, None, 'count'),
+    # Charts
+    (DAY, 'Total', 'sum'),
+    (DAY, 'Total', 'count'),
+    ('Product line', 'Quantity', 'sum'),
+    ('Product line', 'Total', 'sum'),
+    ('Payment', None, 'count'),
+    ('City', 'Rating', 'mean'),
+    # Insights
+    ('City', 'Total', 'sum'),
+    ('Customer type', 'Total', 'mean'),
+]
+
+
+class AggregationPlan:
+    # Collects the aggregate requests of every consumer on the page and answers
+    # them with one groupby pass per dimension over only the cube columns needed.
+    # Means are rebuilt from the summed sum/count columns.
+
+    def __init__(self, requests=()):
+        self.requests = {}
+        for request in requests:
+            self.request(*request)
+
+    def request(self, dimension, measure, reducer):
+        if reducer not in ('sum', 'count', 'mean'):
+            raise ValueError(f"Unknown reducer: {reducer}")
+        self.requests.setdefault(dimension, set()).add((measure, reducer))
+
+    @staticmethod
+    def source_columns(measure, reducer):
+        if measure is None:
+            return [ROWS]
+        if reducer == 'sum':
+            return [sum_column(measure)]
+        if reducer == 'count':
+            return [count_column(measure)]
+        return [sum_column(measure), count_column(measure)]
+
+    def execute(self, cells):
+        results = {}
+        for dimension, wanted in self.requests.items():
+            if dimension is not None and dimension not in cells.columns:
+                continue
+            wanted = [
+                (measure, reducer) for measure, reducer in wanted
+                if all(col in cells.columns for col in self.source_columns(measure, reducer))
+            ]
+            columns = sorted({col for measure, reducer in wanted for col in self.source_columns(measure, reducer)})
+            if dimension is None:
+                sums = cells[columns].sum()
+            else:
+                sums = cells.groupby(dimension, observed=True)[columns].sum()
+
+            for measure, reducer in wanted:
+                if reducer == 'mean':
+                    count = sums[count_column(measure)]
+                    if dimension is None:
+                        value = sums[sum_column(measure)] / count if count else np.nan
+                    else:
+                        value = sums[sum_column(measure)] / count.replace(0, np.nan)
+                else:
+                    value = sums[self.source_columns(measure, reducer)[0]]
+                results[(dimension, measure, reducer)] = value
+        return results
+
+
+def dashboard_plan():
+    return AggregationPlan(DASHBOARD_REQUESTS)
+
+
+# ===================== FILTER STATE =====================
+def filter_state(cube, filters):
+    # Hashable, order-independent form of the filters, used as the result cache key.
+    # A selection keeping every value of a column without missing values is the
+    # same as no filter, so it is dropped.
+    state = []
+    for col, val in filters.items():
+        if col == DATE_COLUMN and isinstance(val, tuple) and len(val) == 2:
+            state.append((col, tuple(val)))
+        elif isinstance(val, list) and val and col in cube.columns:
+            selected = frozenset(val)
+            if not cube[col].isna().any() and selected.issuperset(cube[col].cat.categories):
+                continue
+            state.append((col, selected))
+    return tuple(sorted(state, key=lambda item: item[0]))
+
+
+# ===================== CHART DATA =====================
+def sales_trend_data(results, granularity=DEFAULT_GRANULARITY):
+    # Undated rows never reach the per-day totals; periods with no Total values are dropped
+    daily = pd.DataFrame({
+        'Total': results[(DAY, 'Total', 'sum')],
+        'Count': results[(DAY, 'Total', 'count')],
+    })
+    trend = rollup(daily, granularity)
+    trend = trend[trend['Count'] > 0].sort_index()[['Total']].reset_index()
+    trend['Label'] = [period_label(code, granularity) for code in trend[PERIOD]]
+    return trend
+
+
+def product_qty_data(results):
+    product_qty = results[('Product line', 'Quantity', 'sum')].rename('Quantity').reset_index()
+    return product_qty.sort_values('Quantity', ascending=False)
+
+
+def product_sales_data(results):
+    product_sales = results[('Product line', 'Total', 'sum')].rename('Total').reset_index()
+    return product_sales.sort_values('Total', ascending=False)
+
+
+def payment_counts_data(results):
+    payment_counts = results[('Payment', None, 'count')].sort_values(ascending=False).reset_index()
+    payment_counts.columns = ['Payment Method', 'Count']
+    return payment_counts
+
+
+def city_rating_data(results):
+    city_rating = results[('City', 'Rating', 'mean')].rename('Rating').reset_index()
+    return city_rating.sort_values('Rating', ascending=False)
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+from ingestion import LoadCancelled
+
+# ===================== SETTINGS =====================
+# Uploads at least this large load on a background thread; smaller ones load inline
+BACKGROUND_THRESHOLD_BYTES = float(os.environ.get('SUPERMARKET_BACKGROUND_MB', '1')) * 1024 * 1024
+# A background load finishing within this time (cache hits) is used in the same rerun
+BACKGROUND_GRACE_SECONDS = 0.3
+# How often the loading screen refreshes its progress
+BACKGROUND_POLL_SECONDS = 0.5
+
+
+# ===================== LOAD JOB =====================
+class LoadJob:
+    # One load running on a daemon thread: `target(job)` does the work and returns
+    # its result. While it runs, target reports through the job (report() for the
+    # progress, `preview` for a first look at the data) and calls check() so that
+    # cancel() can stop it between steps. The UI thread only reads the job.
+    #
+    # state: running -> done | failed | cancelled
+
+    def __init__(self, key, target):
+        self.key = key
+        self.state = 'running'
+        self.fraction = 0.0
+        self.text = ''
+        self.preview = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._started = time.perf_counter()
+        self._finished = None
+        self._thread = threading.Thread(target=self._run, args=(target,), name=f'load-{key}', daemon=True)
+        self._thread.start()
+
+    def _run(self, target):
+        try:
+            self.result = target(self)
+            self.state = 'done'
+        except LoadCancelled:
+            self.state = 'cancelled'
+        except Exception as e:
+            self.error = e
+            # A load cancelled while a worker failed counts as cancelled
+            self.state = 'cancelled' if self.cancel_event.is_set() else 'failed'
+        finally:
+            self._finished = time.perf_counter()
+
+    @property
+    def running(self):
+        return self.state == 'running'
+
+    @property
+    def cancelling(self):
+        # Cancel was asked for but the thread has not reached a check yet
+        return self.running and self.cancel_event.is_set()
+
+    @property
+    def seconds(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    def report(self, fraction, text):
+        self.check()
+        self.fraction, self.text = min(max(fraction, 0.0), 1.0), text
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise LoadCancelled()
+
+    def cancel(self):
+        # Returns at once; the thread stops at its next check (a sheet read in one
+        # blocking call is finished first)
+        self.cancel_event.set()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return not self.running
@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from ingestion import CATEGORICAL_COLUMNS, PARSE_WORKERS, TABLE_EXTENSIONS, WORKBOOK_EXTENSIONS, expand_upload
+from aggregates import DEFAULT_GRANULARITY, GRANULARITIES
+from engine import Dataset, FilterSpec, analyze, analyze_by
+
+# Nightly reporting without the web app: the dashboard's KPIs, chart tables and
+# insights for every store file (optionally per branch), computed in parallel
+# across files with the same engine the app uses.
+#
+#   python batch_report.py stores/ --by Branch --output-dir reports/
+#   python batch_report.py a.xlsx b.csv --filter "Payment=Cash,Ewallet" --from 2019-01-01 --to 2019-03-31
+#
+# Parquet output: one file per table (kpis, insights, sales_trend, ...), every row
+# tagged with its Source file and Group (the --by column is kept as the file's
+# group_by attribute). JSON output: one document per source file.
+
+OUTPUT_FORMATS = ['parquet', 'json', 'both']
+ALL_ROWS = '(all)'
+
+
+# ===================== INPUTS =====================
+def is_store_file(name):
+    return name.lower().endswith(WORKBOOK_EXTENSIONS + TABLE_EXTENSIONS + ('.zip',))
+
+
+def input_paths(paths):
+    # Directories are searched (recursively) for workbooks, tables and zip archives
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                found.extend(os.path.join(root, name) for name in sorted(names) if is_store_file(name))
+        else:
+            found.append(path)
+    return found
+
+
+def parse_filters(specs, date_from=None, date_to=None):
+    # "Column=value1,value2" per --filter option
+    categories = {}
+    for spec in specs:
+        col, sep, values = spec.partition('=')
+        if not sep or not values:
+            raise ValueError(f"Filter must look like Column=value1,value2: {spec!r}")
+        categories[col.strip()] = [value.strip() for value in values.split(',')]
+    date_range = None
+    if date_from or date_to:
+        # A missing end leaves the range open on that side
+        date_range = (
+            datetime.date.fromisoformat(date_from) if date_from else None,
+            datetime.date.fromisoformat(date_to) if date_to else None,
+        )
+    return FilterSpec(categories, date_range)
+
+
+# ===================== WORKER =====================
+def report_file(path, filters, by=None, granularity=DEFAULT_GRANULARITY, all_sheets=False):
+    # Process-pool task: every dataset in one input file (a zip archive holds
+    # several) -> list of (source, group, DashboardReport)
+    with open(path, 'rb') as f:
+        data = f.read()
+    reports = []
+    for name, blob in expand_upload(os.path.basename(path), data):
+        source = path if name == os.path.basename(path) else f"{path}/{name}"
+        dataset = Dataset.from_files([blob], all_sheets=all_sheets)
+        reports.append((source, ALL_ROWS, analyze(dataset, filters, granularity)))
+        if by is not None:
+            for value, report in analyze_by(dataset, by, filters, granularity).items():
+                reports.append((source, str(value), report))
+    return reports
+
+
+# ===================== OUTPUTS =====================
+def tagged(frame, source, group):
+    # Tag columns are not named after --by, which a chart table may already have
+    frame = frame.copy()
+    frame.insert(0, 'Group', group)
+    frame.insert(0, 'Source', source)
+    return frame
+
+
+def write_parquet(reports, output_dir, by=None):
+    # KPIs and insights: one row per report; chart tables: stacked
+    rows = {'kpis': [], 'insights': []}
+    frames = {}
+    for source, group, report in reports:
+        rows['kpis'].append({'Source': source, 'Group': group, **vars(report.kpis)})
+        rows['insights'].append({'Source': source, 'Group': group, **vars(report.insights)})
+        for name, table in report.tables().items():
+            frames.setdefault(name, []).append(tagged(table, source, group))
+    tables = {name: pd.DataFrame(records) for name, records in rows.items()}
+    tables.update({name: pd.concat(parts, ignore_index=True) for name, parts in frames.items()})
+
+    written = []
+    for name, table in tables.items():
+        path = os.path.join(output_dir, f"{name}.parquet")
+        # Category columns of different files carry different categories
+        for col in table.columns:
+            if isinstance(table[col].dtype, pd.CategoricalDtype):
+                table[col] = table[col].astype(str)
+        # Kept with the file and read back into DataFrame.attrs
+        table.attrs['group_by'] = by
+        table.to_parquet(path, index=False)
+        written.append(path)
+    return written
+
+
+def json_name(source):
+    return source.replace(os.sep, '_').replace('/', '_').lstrip('._') + '.json'
+
+
+def write_json(reports, output_dir, by=None):
+    documents = {}
+    for source, group, report in reports:
+        document = documents.setdefault(source, {'source': source, 'group_by': by, 'groups': []})
+        document['groups'].append({'group': group, **report.to_dict()})
+
+    written = []
+    for source, document in documents.items():
+        path = os.path.join(output_dir, json_name(source))
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2, default=str)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compute the dashboard's KPIs, chart tables and insights for many store files"
+    )
+    parser.add_argument('inputs', nargs='+', help="workbooks, tables, zip archives or directories")
+    parser.add_argument('--output-dir', default='reports')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='both')
+    parser.add_argument('--by', help="also report every value of this column, e.g. Branch")
+    parser.add_argument('--filter', action='append', default=[], metavar='COLUMN=V1,V2',
+                        help="keep only these values of a column (repeatable)")
+    parser.add_argument('--from', dest='date_from', help="first day, YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="last day, YYYY-MM-DD")
+    parser.add_argument('--granularity', choices=GRANULARITIES, default=DEFAULT_GRANULARITY)
+    parser.add_argument('--all-sheets', action='store_true', help="read every sheet of every workbook")
+    parser.add_argument('--workers', type=int, default=PARSE_WORKERS, help="files processed in parallel")
+    args = parser.parse_args(argv)
+
+    try:
+        filters = parse_filters(args.filter, args.date_from, args.date_to)
+    except ValueError as e:
+        parser.error(str(e))
+    # Typos fail here; a file without one of these columns fails on its own below
+    named = [*filters.categories, *([args.by] if args.by else [])]
+    unknown = [col for col in named if col not in CATEGORICAL_COLUMNS]
+    if unknown:
+        parser.error(f"can only filter or group by {', '.join(CATEGORICAL_COLUMNS)}, not {', '.join(unknown)}")
+    paths = input_paths(args.inputs)
+    if not paths:
+        parser.error("no store files found")
+
+    results, failures = {}, []
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(paths)))) as pool:
+        futures = {
+            pool.submit(report_file, path, filters, args.by, args.granularity, args.all_sheets): path
+            for path in paths
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+                print(f"[{done}/{len(paths)}] {path}", file=sys.stderr)
+            except Exception as e:
+                failures.append((path, e))
+                print(f"[{done}/{len(paths)}] {path}: FAILED ({e})", file=sys.stderr)
+
+    # Output order follows the input order, not completion order
+    reports = [report for path in paths if path in results for report in results[path]]
+    os.makedirs(args.output_dir, exist_ok=True)
+    written = []
+    if reports and args.format in ('parquet', 'both'):
+        written += write_parquet(reports, args.output_dir, args.by)
+    if reports and args.format in ('json', 'both'):
+        written += write_json(reports, args.output_dir, args.by)
+    print(f"{len(results)} files, {len(reports)} reports -> {len(written)} files in {args.output_dir}")
+    if failures:
+        print(f"{len(failures)} files failed:", file=sys.stderr)
+        for path, e in failures:
+            print(f"  {path}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,452 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Same frame semantics as the dashboard
+pd.set_option("mode.copy_on_write", True)
+
+from ingestion import CATEGORICAL_COLUMNS, DATE_COLUMN, compact_frame, read_workbooks
+from filters import BitmapIndex, DateIndex, IncrementalFilter
+from export import EXCEL_MAX_ROWS, EXPORT_FORMATS, export_bytes
+from outofcore import DatasetStore, build_dataset_cube, cube_backends
+from aggregates import (
+    DASHBOARD_REQUESTS,
+    DAY,
+    GRANULARITIES,
+    AggregationPlan,
+    build_cube,
+    city_rating_data,
+    dashboard_plan,
+    payment_counts_data,
+    product_qty_data,
+    product_sales_data,
+    sales_trend_data,
+    slice_cube,
+)
+
+# Headless benchmark of the dashboard's data path: synthetic sales files of a given
+# size are parsed, indexed, filtered, aggregated and exported with the same
+# functions the app calls, each size in a fresh process so its peak RSS is its own.
+# Every size also checks that the out-of-core cube of each installed backend
+# (DuckDB, Arrow) equals the in-memory one.
+#
+#   python benchmark.py --rows 10000 100000
+#   python benchmark.py --save-baseline          # record benchmark_baseline.json
+#   python benchmark.py                          # exits 1 on a regression
+
+# ===================== SETTINGS =====================
+BENCH_DIR = os.environ.get(
+    'SUPERMARKET_BENCH_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'bench')
+)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+# Absolute slack on top of the tolerance, so sub-millisecond stages do not flap
+NOISE_FLOOR_MS = 1.0
+# Writing (and parsing) larger workbooks takes minutes and 1,048,576 rows is the
+# sheet limit, so 'auto' switches to Parquet above this size
+XLSX_MAX_ROWS = 100_000
+FILE_FORMATS = ['auto', 'xlsx', 'csv', 'parquet']
+
+
+# ===================== SYNTHETIC DATA =====================
+BRANCH_CITIES = [('A', 'Yangon'), ('B', 'Mandalay'), ('C', 'Naypyitaw')]
+CUSTOMER_TYPES = ['Member', 'Normal']
+GENDERS = ['Female', 'Male']
+PRODUCT_LINES = [
+    'Electronic accessories', 'Fashion accessories', 'Food and beverages',
+    'Health and beauty', 'Home and lifestyle', 'Sports and travel',
+]
+PAYMENTS = ['Cash', 'Credit card', 'Ewallet']
+FIRST_DAY = pd.Timestamp('2019-01-01')
+N_DAYS = 365
+
+
+def generate_sales(n_rows, seed=0):
+    # Same columns and value ranges as the supermarket sales workbook; the same
+    # (n_rows, seed) always gives the same frame
+    rng = np.random.default_rng(seed)
+    branch = rng.integers(0, len(BRANCH_CITIES), n_rows)
+    unit_price = rng.uniform(10, 100, n_rows).round(2)
+    quantity = rng.integers(1, 11, n_rows)
+    tax = (unit_price * quantity * 0.05).round(4)
+    invoice = pd.Series(rng.permutation(n_rows) + 100_000_000).astype(str)
+    return pd.DataFrame({
+        'Invoice ID': invoice.str[:3] + '-' + invoice.str[3:5] + '-' + invoice.str[5:9],
+        'Branch': np.array([b for b, _ in BRANCH_CITIES])[branch],
+        'City': np.array([c for _, c in BRANCH_CITIES])[branch],
+        'Customer type': rng.choice(CUSTOMER_TYPES, n_rows),
+        'Gender': rng.choice(GENDERS, n_rows),
+        'Product line': rng.choice(PRODUCT_LINES, n_rows),
+        'Unit price': unit_price,
+        'Quantity': quantity,
+        'Tax 5%': tax,
+        'Total': (unit_price * quantity + tax).round(4),
+        'Date': FIRST_DAY + pd.to_timedelta(rng.integers(0, N_DAYS, n_rows), unit='D'),
+        'Payment': rng.choice(PAYMENTS, n_rows),
+        'Rating': rng.uniform(4, 10, n_rows).round(1),
+    })
+
+
+def file_format_for(n_rows, fmt):
+    if fmt == 'auto':
+        return 'xlsx' if n_rows <= XLSX_MAX_ROWS else 'parquet'
+    if fmt == 'xlsx' and n_rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"{n_rows:,} rows do not fit in one worksheet")
+    return fmt
+
+
+def dataset_path(n_rows, seed, fmt):
+    return os.path.join(BENCH_DIR, f"sales-{n_rows}-{seed}.{fmt}")
+
+
+def ensure_dataset(n_rows, seed, fmt):
+    # Generated once per (rows, seed, format) and reused by later runs
+    path = dataset_path(n_rows, seed, fmt)
+    if os.path.exists(path):
+        return path
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    df = generate_sales(n_rows, seed)
+    # The writers pick the format from the extension, so the temporary name keeps it
+    tmp_path = os.path.join(BENCH_DIR, f".{uuid.uuid4().hex}.{fmt}")
+    try:
+        if fmt == 'xlsx':
+            df.to_excel(tmp_path, index=False, engine='openpyxl')
+        elif fmt == 'csv':
+            df.to_csv(tmp_path, index=False)
+        else:
+            df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+# ===================== SCENARIOS =====================
+# Filter states a user would typically set; each one is one latency sample
+FILTER_SCENARIOS = {
+    'no filter': {},
+    'one branch': {'Branch': ['A']},
+    'two product lines, card': {
+        'Product line': ['Food and beverages', 'Health and beauty'],
+        'Payment': ['Credit card'],
+    },
+    'second quarter': {DATE_COLUMN: (datetime.date(2019, 4, 1), datetime.date(2019, 6, 30))},
+}
+EXPORT_SCENARIO = 'one branch'
+KPI_REQUESTS = [request for request in DASHBOARD_REQUESTS if request[0] is None]
+
+
+# ===================== CUBE PARITY =====================
+# Sums of float32 Ratings differ from float64 ones in the last digits
+CUBE_RTOL = 1e-6
+
+
+def cube_cells(cube):
+    # Cells in a comparable form: keys as text, sorted by key
+    keys = [col for col in cube.columns if col in CATEGORICAL_COLUMNS or col == DAY]
+    cells = cube[sorted(cube.columns)].copy()
+    for col in keys:
+        cells[col] = cells[col].astype('datetime64[ns]' if col == DAY else object).astype(str)
+    return cells.sort_values(keys).reset_index(drop=True) if keys else cells
+
+
+def cube_differences(expected, actual):
+    expected, actual = cube_cells(expected), cube_cells(actual)
+    if list(expected.columns) != list(actual.columns):
+        return [f"columns {list(actual.columns)} instead of {list(expected.columns)}"]
+    if len(expected) != len(actual):
+        return [f"{len(actual):,} cells instead of {len(expected):,}"]
+    differences = []
+    for col in expected.columns:
+        if expected[col].dtype == object:
+            same = (expected[col] == actual[col]).all()
+        else:
+            same = np.allclose(expected[col], actual[col], rtol=CUBE_RTOL)
+        if not same:
+            differences.append(f"column {col} differs")
+    return differences
+
+
+def cube_parity(data, cube):
+    # {backend: differences} between the out-of-core cube of `data` and `cube`
+    # (every list empty when they agree)
+    directory = tempfile.mkdtemp(dir=BENCH_DIR)
+    try:
+        store = DatasetStore(directory)
+        store.put('parity', data)
+        dataset, columns = store.dataset(['parity']), store.columns(['parity'])
+        return {
+            backend: cube_differences(cube, build_dataset_cube(dataset, columns, backend))
+            for backend in cube_backends()
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# ===================== MEASUREMENT =====================
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def latency_stats(seconds, rows):
+    seconds = np.asarray(seconds)
+    p50 = float(np.percentile(seconds, 50))
+    return {
+        'samples': len(seconds),
+        'p50_ms': p50 * 1000,
+        'p95_ms': float(np.percentile(seconds, 95)) * 1000,
+        'max_ms': float(seconds.max()) * 1000,
+        'rows': rows,
+        'rows_per_second': rows / p50 if p50 > 0 else None,
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def run_size(n_rows, seed, fmt, repeat, export_format):
+    # Runs in a fresh process: every stage `repeat` times on one generated file
+    with open(dataset_path(n_rows, seed, fmt), 'rb') as f:
+        data = f.read()
+    stages = {}
+
+    samples = []
+    for _ in range(repeat):
+        df, seconds = timed(lambda: compact_frame(read_workbooks([data], workers=1)[0]))
+        samples.append(seconds)
+    stages['ingest'] = latency_stats(samples, len(df))
+
+    samples = []
+    for _ in range(repeat):
+        cube, seconds = timed(lambda: build_cube(df))
+        samples.append(seconds)
+    stages['cube'] = latency_stats(samples, len(df))
+    parity = cube_parity(data, cube)
+
+    samples = []
+    for _ in range(repeat):
+        (bitmap_index, date_index), seconds = timed(lambda: (BitmapIndex(df), DateIndex(df[DATE_COLUMN])))
+        samples.append(seconds)
+    stages['index'] = latency_stats(samples, len(df))
+
+    # Dashboard path: cube slice + one planned aggregation pass for every consumer
+    samples, results = [], {}
+    for _ in range(repeat):
+        for name, filters in FILTER_SCENARIOS.items():
+            results[name], seconds = timed(lambda: dashboard_plan().execute(slice_cube(cube, filters)))
+            samples.append(seconds)
+    stages['filter (cube)'] = latency_stats(samples, len(df))
+
+    # Raw-data path: row mask from the bitmap and date indexes, cold per sample
+    samples, masks = [], {}
+    for _ in range(repeat):
+        for name, filters in FILTER_SCENARIOS.items():
+            row_filter = IncrementalFilter(bitmap_index, date_index)
+            masks[name], seconds = timed(lambda: row_filter.mask(filters))
+            samples.append(seconds)
+    stages['filter (rows)'] = latency_stats(samples, len(df))
+
+    samples = []
+    kpi_plan = AggregationPlan(KPI_REQUESTS)
+    for _ in range(repeat):
+        for filters in FILTER_SCENARIOS.values():
+            cells = slice_cube(cube, filters)
+            _, seconds = timed(lambda: kpi_plan.execute(cells))
+            samples.append(seconds)
+    stages['kpis'] = latency_stats(samples, len(df))
+
+    def chart_tables(results):
+        tables = [sales_trend_data(results, granularity) for granularity in GRANULARITIES]
+        return tables + [
+            product_qty_data(results),
+            product_sales_data(results),
+            payment_counts_data(results),
+            city_rating_data(results),
+        ]
+
+    samples = []
+    for _ in range(repeat):
+        for name in FILTER_SCENARIOS:
+            _, seconds = timed(lambda: chart_tables(results[name]))
+            samples.append(seconds)
+    stages['chart data'] = latency_stats(samples, len(df))
+
+    samples = []
+    export_rows = df[masks[EXPORT_SCENARIO]]
+    for _ in range(repeat):
+        payload, seconds = timed(lambda: export_bytes(export_rows, export_format))
+        samples.append(seconds)
+    stages[f'export ({export_format})'] = latency_stats(samples, len(export_rows))
+    stages[f'export ({export_format})']['bytes'] = len(payload)
+
+    return {
+        'rows': n_rows,
+        'file_format': fmt,
+        'file_bytes': len(data),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'stages': stages,
+        'cube_parity': parity,
+    }
+
+
+def run_benchmark(sizes, seed=0, fmt='auto', repeat=DEFAULT_REPEAT, export_format='CSV'):
+    # Spawned (not forked) workers start from an empty heap, so the peak RSS of a
+    # size is not inflated by an earlier, larger one
+    context = multiprocessing.get_context('spawn')
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': {},
+    }
+    for n_rows in sizes:
+        size_format = file_format_for(n_rows, fmt)
+        print(f"· {n_rows:,} rows: generating {size_format}...", file=sys.stderr, flush=True)
+        ensure_dataset(n_rows, seed, size_format)
+        print(f"· {n_rows:,} rows: running stages...", file=sys.stderr, flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_size, n_rows, seed, size_format, repeat, export_format).result()
+        report['sizes'][str(n_rows)] = result
+    return report
+
+
+# ===================== REPORTING =====================
+def format_report(report):
+    lines = []
+    for size, result in report['sizes'].items():
+        rss = result['peak_rss_bytes']
+        rss_text = f"{rss / 1024 ** 2:,.0f} MB" if rss else "n/a"
+        lines.append(
+            f"\n{int(size):,} rows ({result['file_format']}, {result['file_bytes'] / 1024 ** 2:,.1f} MB)"
+            f" · peak RSS {rss_text}"
+        )
+        lines.append(f"  {'stage':<18}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'rows/s':>15}")
+        for stage, stats in result['stages'].items():
+            throughput = f"{stats['rows_per_second']:,.0f}" if stats['rows_per_second'] else "-"
+            lines.append(
+                f"  {stage:<18}{stats['p50_ms']:>11,.1f}{stats['p95_ms']:>11,.1f}"
+                f"{stats['max_ms']:>11,.1f}{throughput:>15}"
+            )
+        for backend, differences in result['cube_parity'].items():
+            lines.append(f"  cube parity ({backend}): {'; '.join(differences) or 'same as in memory'}")
+    return "\n".join(lines)
+
+
+def parity_failures(report):
+    return [
+        f"{int(size):,} rows · {backend} cube: {difference}"
+        for size, result in report['sizes'].items()
+        for backend, differences in result['cube_parity'].items()
+        for difference in differences
+    ]
+
+
+def compare_to_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    # A stage regresses when its median latency grows by more than `tolerance` (and
+    # NOISE_FLOOR_MS) over the baseline, a size when its peak RSS grows by more than
+    # `tolerance`. Sizes or stages the baseline does not have are not compared.
+    regressions = []
+    for size, result in report['sizes'].items():
+        reference = baseline.get('sizes', {}).get(size)
+        if reference is None:
+            continue
+        for stage, stats in result['stages'].items():
+            ref = reference['stages'].get(stage)
+            if ref and stats['p50_ms'] > ref['p50_ms'] * (1 + tolerance) + NOISE_FLOOR_MS:
+                regressions.append(
+                    f"{int(size):,} rows · {stage}: p50 {stats['p50_ms']:,.1f} ms "
+                    f"vs baseline {ref['p50_ms']:,.1f} ms (+{stats['p50_ms'] / ref['p50_ms'] - 1:.0%})"
+                )
+        rss, ref_rss = result['peak_rss_bytes'], reference.get('peak_rss_bytes')
+        if rss and ref_rss and rss > ref_rss * (1 + tolerance):
+            regressions.append(
+                f"{int(size):,} rows · peak RSS: {rss / 1024 ** 2:,.0f} MB "
+                f"vs baseline {ref_rss / 1024 ** 2:,.0f} MB (+{rss / ref_rss - 1:.0%})"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data path on synthetic sales data")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES, help="dataset sizes in rows")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="samples per stage and scenario")
+    parser.add_argument('--format', choices=FILE_FORMATS, default='auto', help="generated file format")
+    parser.add_argument('--export-format', choices=list(EXPORT_FORMATS), default='CSV')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown / RSS growth over the baseline, e.g. 0.25 for 25%%")
+    parser.add_argument('--output', help="also write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        report = run_benchmark(args.rows, args.seed, args.format, args.repeat, args.export_format)
+    except ValueError as e:
+        parser.error(str(e))
+    print(format_report(report))
+    failures = parity_failures(report)
+    if failures:
+        print("\nOUT-OF-CORE CUBE MISMATCH:", file=sys.stderr)
+        for line in failures:
+            print(f"  ✗ {line}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):", file=sys.stderr)
+        for line in regressions:
+            print(f"  ✗ {line}", file=sys.stderr)
+        return 1
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
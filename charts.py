@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+# ===================== SETTINGS =====================
+DEFAULT_POINT_BUDGET = 1000
+DEFAULT_TOP_N = 10
+WEBGL_THRESHOLD = 1000
+OTHER_LABEL = 'Other'
+
+
+# ===================== LINE SERIES =====================
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: positions of `threshold` points that keep the
+    # visual shape of the series. First and last points are always kept.
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def downsample_line(df, x_col, y_col, budget):
+    # `x_col` must be numeric (e.g. integer period codes) for the triangle areas
+    if len(df) <= budget:
+        return df
+    return df.iloc[lttb(df[x_col].to_numpy(), df[y_col].to_numpy(), budget)]
+
+
+# ===================== CATEGORICAL BARS =====================
+def top_n_with_other(df, label_col, value_col, n):
+    # Keeps the n largest categories and sums the rest into one "Other" row;
+    # `df` must already be sorted by value descending
+    if len(df) <= n:
+        return df
+    top = df.iloc[:n].astype({label_col: object})
+    other = pd.DataFrame({label_col: [OTHER_LABEL], value_col: [df[value_col].iloc[n:].sum()]})
+    return pd.concat([top, other], ignore_index=True)
+
+
+# ===================== PAYLOAD =====================
+def figure_payload_bytes(fig):
+    # Size of the figure JSON that is sent over the websocket
+    return len(fig.to_json().encode('utf-8'))
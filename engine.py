@@ -0,0 +1,222 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from ingestion import CATEGORICAL_COLUMNS, DATE_COLUMN, combine_frames, compact_frame, read_workbooks
+from aggregates import (
+    DAY,
+    DEFAULT_GRANULARITY,
+    build_cube,
+    city_rating_data,
+    dashboard_plan,
+    payment_counts_data,
+    product_qty_data,
+    product_sales_data,
+    sales_trend_data,
+    slice_cube,
+)
+
+# UI-independent entry point to every number the dashboard shows. The app, the
+# batch report and scripts all go through the same functions:
+#
+#   dataset = Dataset.from_files([data])
+#   report = analyze(dataset, FilterSpec({'Branch': ['A']}))
+#   report.kpis.total_sales, report.product_sales, report.insights.top_city
+
+
+# ===================== FILTER SPEC =====================
+@dataclass(frozen=True)
+class FilterSpec:
+    # Selected values per categorical column (a column left out is not filtered)
+    # and an optional inclusive (start, end) date range; either end may be None
+    # for a range open on that side
+    categories: dict = field(default_factory=dict)
+    date_range: Optional[tuple] = None
+
+    def as_filters(self, day_bounds=None):
+        # The {column: selection} form slice_cube and IncrementalFilter take. They
+        # need both ends of the date range, so open ends are taken from
+        # `day_bounds`, the (first, last) day of the data.
+        filters = {col: list(values) for col, values in self.categories.items()}
+        if self.date_range is not None:
+            start, end = self.date_range
+            if day_bounds is not None:
+                start = day_bounds[0] if start is None else start
+                end = day_bounds[1] if end is None else end
+            filters[DATE_COLUMN] = (start, end)
+        return filters
+
+    def narrowed(self, col, values):
+        return FilterSpec({**self.categories, col: list(values)}, self.date_range)
+
+
+# ===================== DATASET =====================
+@dataclass
+class Dataset:
+    # Compact dashboard frame plus its aggregate cube; every result is read from
+    # the cube. `frame` may be None for a cube built elsewhere (out-of-core store).
+    cube: pd.DataFrame
+    columns: list
+    frame: Optional[pd.DataFrame] = None
+
+    @classmethod
+    def from_frame(cls, df):
+        df = compact_frame(df)
+        return cls(build_cube(df), list(df.columns), df)
+
+    @classmethod
+    def from_files(cls, blobs, all_sheets=False, workers=1):
+        # Raw bytes of workbooks / tables, stacked into one dataset
+        frames = [compact_frame(df) for df in read_workbooks(blobs, all_sheets=all_sheets, workers=workers)]
+        df = frames[0] if len(frames) == 1 else combine_frames(frames)
+        return cls(build_cube(df), list(df.columns), df)
+
+    def values(self, col):
+        # Values a categorical column takes, in cube order
+        return self.cube[col].dropna().unique().tolist() if col in self.cube.columns else []
+
+    def check_filterable(self, cols):
+        # Filters and groupings only work on categorical columns the data has;
+        # the cube would otherwise ignore them and report every row
+        missing = [col for col in cols if col not in CATEGORICAL_COLUMNS or col not in self.columns]
+        if missing:
+            available = [col for col in CATEGORICAL_COLUMNS if col in self.columns]
+            raise ValueError(
+                f"Cannot filter or group by {', '.join(missing)}; "
+                f"this data has {', '.join(available) or 'no filter columns'}"
+            )
+
+
+# ===================== RESULTS =====================
+@dataclass
+class Kpis:
+    # None when the dataset lacks the column(s) a KPI needs
+    rows: int
+    total_sales: Optional[float]
+    products_sold: Optional[float]
+    sales_after_tax: Optional[float]
+    average_rating: Optional[float]
+
+
+@dataclass
+class Insights:
+    top_product: Optional[str] = None
+    top_product_sales: Optional[float] = None
+    top_city: Optional[str] = None
+    top_city_sales: Optional[float] = None
+    best_customer_type: Optional[str] = None
+    best_customer_average: Optional[float] = None
+
+
+@dataclass
+class DashboardReport:
+    # Chart tables are None when the dataset lacks their columns
+    filters: FilterSpec
+    granularity: str
+    kpis: Kpis
+    insights: Insights
+    sales_trend: Optional[pd.DataFrame]
+    product_qty: Optional[pd.DataFrame]
+    product_sales: Optional[pd.DataFrame]
+    payment_counts: Optional[pd.DataFrame]
+    city_rating: Optional[pd.DataFrame]
+
+    CHART_TABLES = ('sales_trend', 'product_qty', 'product_sales', 'payment_counts', 'city_rating')
+
+    def tables(self):
+        return {name: getattr(self, name) for name in self.CHART_TABLES if getattr(self, name) is not None}
+
+    def to_dict(self):
+        return {
+            'filters': {
+                'categories': self.filters.categories,
+                'date_range': [
+                    None if day is None else str(day) for day in self.filters.date_range
+                ] if self.filters.date_range else None,
+            },
+            'granularity': self.granularity,
+            'kpis': vars(self.kpis),
+            'insights': vars(self.insights),
+            **{name: table.to_dict(orient='records') for name, table in self.tables().items()},
+        }
+
+
+# ===================== COMPUTATION =====================
+def compute_kpis(results, columns):
+    def value(key, *needed):
+        return float(results[key]) if all(col in columns for col in needed) else None
+
+    total_sales = value((None, 'Total', 'sum'), 'Total')
+    total_tax = value((None, 'Tax 5%', 'sum'), 'Total', 'Tax 5%')
+    return Kpis(
+        rows=int(results[(None, None, 'count')]),
+        total_sales=total_sales,
+        products_sold=value((None, 'Quantity', 'sum'), 'Quantity'),
+        # Sales after tax = Total - Tax
+        sales_after_tax=total_sales - total_tax if total_tax is not None else None,
+        average_rating=value((None, 'Rating', 'mean'), 'Rating'),
+    )
+
+
+def compute_insights(results, columns):
+    insights = Insights()
+    if 'Total' not in columns:
+        return insights
+
+    # Top performing product
+    product_totals = results.get(('Product line', 'Total', 'sum'))
+    if 'Product line' in columns and not product_totals.empty:
+        insights.top_product = product_totals.idxmax()
+        insights.top_product_sales = float(product_totals.max())
+
+    # Best performing city
+    city_totals = results.get(('City', 'Total', 'sum'))
+    if 'City' in columns and not city_totals.empty:
+        insights.top_city = city_totals.idxmax()
+        insights.top_city_sales = float(city_totals.max())
+
+    # Customer type with the highest average sale
+    customer_avg = results.get(('Customer type', 'Total', 'mean'))
+    if 'Customer type' in columns and customer_avg.notna().any():
+        insights.best_customer_type = customer_avg.idxmax()
+        insights.best_customer_average = float(customer_avg.max())
+    return insights
+
+
+def compute_results(cube, filters=None):
+    # Every aggregate the dashboard needs for one filter state, in one planned pass
+    # per dimension over the matching cube cells
+    filters = filters if filters is not None else FilterSpec()
+    day_bounds = (cube[DAY].min(), cube[DAY].max()) if DAY in cube.columns else None
+    return dashboard_plan().execute(slice_cube(cube, filters.as_filters(day_bounds)))
+
+
+def analyze(dataset, filters=None, granularity=DEFAULT_GRANULARITY):
+    filters = filters if filters is not None else FilterSpec()
+    dataset.check_filterable(filters.categories)
+    columns = dataset.columns
+    results = compute_results(dataset.cube, filters)
+
+    def table(compute, *needed):
+        return compute(results) if all(col in columns for col in needed) else None
+
+    return DashboardReport(
+        filters=filters,
+        granularity=granularity,
+        kpis=compute_kpis(results, columns),
+        insights=compute_insights(results, columns),
+        sales_trend=table(lambda r: sales_trend_data(r, granularity), 'Date', 'Total'),
+        product_qty=table(product_qty_data, 'Product line', 'Quantity'),
+        product_sales=table(product_sales_data, 'Product line', 'Total'),
+        payment_counts=table(payment_counts_data, 'Payment'),
+        city_rating=table(city_rating_data, 'City', 'Rating'),
+    )
+
+
+def analyze_by(dataset, col, filters=None, granularity=DEFAULT_GRANULARITY):
+    # One report per value of `col` (e.g. every branch), within `filters`
+    filters = filters if filters is not None else FilterSpec()
+    dataset.check_filterable([col])
+    return {value: analyze(dataset, filters.narrowed(col, [value]), granularity) for value in dataset.values(col)}
+
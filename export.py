@@ -0,0 +1,83 @@
+import gzip
+import os
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ===================== SETTINGS =====================
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_CACHE_MAX_MB = float(os.environ.get('SUPERMARKET_EXPORT_CACHE_MAX_MB', '512'))
+EXCEL_MAX_ROWS = 1_048_575  # one row of the sheet is the header
+
+# Label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'CSV (gzip)': ('csv.gz', 'application/gzip'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'XLSX': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+# ===================== WRITERS =====================
+def write_csv(df, fileobj, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Serializes chunk by chunk so only one chunk of text exists at a time
+    fileobj.write(df.iloc[:0].to_csv(index=False).encode('utf-8'))
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        fileobj.write(chunk.to_csv(index=False, header=False).encode('utf-8'))
+
+
+def write_xlsx(df, fileobj):
+    # Frames longer than one sheet allows spill over into Sheet2, Sheet3, ...
+    with pd.ExcelWriter(fileobj, engine='openpyxl') as writer:
+        n_sheets = max(1, -(-len(df) // EXCEL_MAX_ROWS))
+        for i in range(n_sheets):
+            part = df.iloc[i * EXCEL_MAX_ROWS:(i + 1) * EXCEL_MAX_ROWS]
+            part.to_excel(writer, sheet_name=f"Sheet{i + 1}", index=False)
+
+
+def export_bytes(df, fmt):
+    buffer = BytesIO()
+    if fmt == 'CSV':
+        write_csv(df, buffer)
+    elif fmt == 'CSV (gzip)':
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=6) as gz:
+            write_csv(df, gz)
+    elif fmt == 'Parquet':
+        df.to_parquet(buffer, index=False)
+    elif fmt == 'XLSX':
+        write_xlsx(df, buffer)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return buffer.getvalue()
+
+
+def export_frames(frames, fmt):
+    # Same formats as export_bytes from an iterator of row chunks, so a scan is
+    # never held as one frame (except for XLSX, which is capped by the sheet size)
+    buffer = BytesIO()
+    if fmt in ('CSV', 'CSV (gzip)'):
+        fileobj = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=6) if fmt == 'CSV (gzip)' else buffer
+        header = True
+        for frame in frames:
+            fileobj.write(frame.to_csv(index=False, header=header).encode('utf-8'))
+            header = False
+        if fileobj is not buffer:
+            fileobj.close()
+    elif fmt == 'Parquet':
+        writer = None
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(buffer, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    elif fmt == 'XLSX':
+        chunks = list(frames)
+        write_xlsx(pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(), buffer)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return buffer.getvalue()
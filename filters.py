@@ -0,0 +1,174 @@
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingestion import CATEGORICAL_COLUMNS, DATE_COLUMN
+
+# ===================== SETTINGS =====================
+FILTER_MASK_CACHE_SIZE = 32
+
+
+# ===================== BITMAP INDEX =====================
+class BitmapIndex:
+    # One packed bitmap (1 bit per row) for every distinct value of every filter
+    # column, built once per dataset. A multiselect becomes an OR of its value
+    # bitmaps, filters are ANDed together, and rows are materialized only once.
+
+    def __init__(self, df, columns=CATEGORICAL_COLUMNS):
+        self.n_rows = len(df)
+        self.n_bytes = (self.n_rows + 7) // 8
+        self.bitmaps = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            values = df[col].astype('category')
+            codes = values.cat.codes.to_numpy()
+            self.bitmaps[col] = {
+                value: np.packbits(codes == i)
+                for i, value in enumerate(values.cat.categories)
+            }
+
+    def restricts(self, col, selected):
+        return col in self.bitmaps and isinstance(selected, list) and bool(selected)
+
+    def column_bits(self, col, selected):
+        column_bits = np.zeros(self.n_bytes, dtype=np.uint8)
+        for value in selected:
+            bits = self.bitmaps[col].get(value)
+            if bits is not None:
+                np.bitwise_or(column_bits, bits, out=column_bits)
+        return column_bits
+
+    def select(self, filters):
+        # Packed bitmap of the rows passing every categorical filter, or None
+        # when no categorical filter restricts anything
+        packed = None
+        for col, selected in filters.items():
+            if not self.restricts(col, selected):
+                continue
+            column_bits = self.column_bits(col, selected)
+            packed = column_bits if packed is None else np.bitwise_and(packed, column_bits, out=packed)
+        return packed
+
+    def mask(self, filters):
+        packed = self.select(filters)
+        if packed is None:
+            return np.ones(self.n_rows, dtype=bool)
+        return np.unpackbits(packed, count=self.n_rows).view(bool)
+
+    def nbytes(self):
+        return sum(bits.nbytes for values in self.bitmaps.values() for bits in values.values())
+
+
+# ===================== DATE INDEX =====================
+class DateIndex:
+    # Argsort permutation of the Date column, built once per dataset. A date_input
+    # range becomes two binary searches instead of two full-column comparisons.
+    # NaT sorts last and is never inside a range.
+
+    def __init__(self, dates):
+        values = dates.to_numpy(dtype='datetime64[ns]')
+        self.n_rows = len(values)
+        self.n_valid = int((~np.isnat(values)).sum())
+        self.order = np.argsort(values, kind='stable')[:self.n_valid]
+        self.sorted_dates = values[self.order]
+
+    def bounds(self):
+        if not self.n_valid:
+            return None
+        return pd.Timestamp(self.sorted_dates[0]), pd.Timestamp(self.sorted_dates[-1])
+
+    def positions(self, start, end):
+        # Rows dated anywhere from the start day through the whole end day
+        lo = np.searchsorted(self.sorted_dates, pd.Timestamp(start).to_datetime64(), side='left')
+        hi = np.searchsorted(
+            self.sorted_dates, (pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64(), side='left'
+        )
+        return self.order[lo:hi]
+
+    def mask(self, start, end):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.positions(start, end)] = True
+        return mask
+
+
+# ===================== INCREMENTAL FILTER =====================
+class IncrementalFilter:
+    # Per-session filter evaluator. Column bitmaps are memoized by
+    # (column, frozenset(selected values)) in a bounded LRU, so changing one
+    # multiselect only ORs the bitmaps of that column. The date mask is narrowed
+    # or widened in place by the days that entered or left the range.
+
+    def __init__(self, bitmap_index, date_index, max_masks=FILTER_MASK_CACHE_SIZE):
+        self.bitmap_index = bitmap_index
+        self.date_index = date_index
+        self.max_masks = max_masks
+        self._column_masks = OrderedDict()
+        self._date_range = None
+        self._date_mask = None
+        self._state = None
+        self._row_mask = None
+
+    def column_bits(self, col, selected):
+        key = (col, frozenset(selected))
+        bits = self._column_masks.get(key)
+        if bits is None:
+            bits = self.bitmap_index.column_bits(col, selected)
+            self._column_masks[key] = bits
+            while len(self._column_masks) > self.max_masks:
+                self._column_masks.popitem(last=False)
+        else:
+            self._column_masks.move_to_end(key)
+        return bits
+
+    def date_mask(self, start, end):
+        one_day = datetime.timedelta(days=1)
+        previous = self._date_range
+        if previous == (start, end):
+            return self._date_mask
+        if previous is None or start > previous[1] or end < previous[0]:
+            self._date_mask = self.date_index.mask(start, end)
+        else:
+            old_start, old_end = previous
+            mask = self._date_mask
+            if start > old_start:
+                mask[self.date_index.positions(old_start, start - one_day)] = False
+            elif start < old_start:
+                mask[self.date_index.positions(start, old_start - one_day)] = True
+            if end < old_end:
+                mask[self.date_index.positions(end + one_day, old_end)] = False
+            elif end > old_end:
+                mask[self.date_index.positions(old_end + one_day, end)] = True
+        self._date_range = (start, end)
+        return self._date_mask
+
+    def mask(self, filters):
+        date_range = filters.get(DATE_COLUMN)
+        if not (isinstance(date_range, tuple) and len(date_range) == 2 and self.date_index is not None):
+            date_range = None
+        state = (
+            frozenset(
+                (col, frozenset(selected)) for col, selected in filters.items()
+                if self.bitmap_index.restricts(col, selected)
+            ),
+            date_range,
+        )
+        if state == self._state:
+            return self._row_mask
+
+        packed = None
+        for col, selected in filters.items():
+            if self.bitmap_index.restricts(col, selected):
+                bits = self.column_bits(col, selected)
+                packed = bits if packed is None else np.bitwise_and(packed, bits)
+        if packed is None:
+            row_mask = np.ones(self.bitmap_index.n_rows, dtype=bool)
+        else:
+            row_mask = np.unpackbits(packed, count=self.bitmap_index.n_rows).view(bool)
+        if date_range is not None:
+            row_mask &= self.date_mask(*date_range)
+
+        self._state, self._row_mask = state, row_mask
+        return row_mask
@@ -0,0 +1,468 @@
+import contextlib
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+# ===================== SCHEMA =====================
+# Sheet is only present when every sheet of the workbooks is read
+SHEET_COLUMN = 'Sheet'
+CATEGORICAL_COLUMNS = ['Branch', 'City', 'Customer type', 'Gender', 'Product line', 'Payment', SHEET_COLUMN]
+NUMERIC_COLUMNS = ['Total', 'Quantity', 'Rating', 'Tax 5%']
+DATE_COLUMN = 'Date'
+DASHBOARD_COLUMNS = [DATE_COLUMN] + NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
+
+# ===================== STREAMING SETTINGS =====================
+STREAM_BATCH_ROWS = 50_000
+# Rows between progress reports inside a batch
+STREAM_PROGRESS_ROWS = 5_000
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+
+# ===================== MULTI-FILE SETTINGS =====================
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xls')
+TABLE_EXTENSIONS = ('.csv', '.csv.gz', '.parquet', '.feather')
+PARSE_WORKERS = int(os.environ.get('SUPERMARKET_PARSE_WORKERS', str(os.cpu_count() or 1)))
+
+# ===================== PREVIEW SETTINGS =====================
+PREVIEW_ROWS = int(os.environ.get('SUPERMARKET_PREVIEW_ROWS', '100'))
+# How often a cancellable load looks at its cancel event while workers parse
+CANCEL_POLL_SECONDS = 0.2
+
+
+class LoadCancelled(Exception):
+    # Raised inside a load whose cancel event was set
+    pass
+
+
+# ===================== HASHING =====================
+def file_digest(data):
+    # Content hash of the uploaded bytes, used as the cache key for every parse
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def dataset_digest(keys):
+    # Key of a dataset built from several files, in upload order
+    if len(keys) == 1:
+        return keys[0]
+    return 'set-' + hashlib.blake2b('\n'.join(keys).encode('utf-8'), digest_size=16).hexdigest()
+
+
+# ===================== UPLOADS =====================
+def expand_upload(name, data):
+    # A zip archive stands for the workbooks and tables inside it, in name order
+    if not name.lower().endswith('.zip'):
+        return [(name, data)]
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        members = sorted(
+            (info for info in archive.infolist()
+             if not info.is_dir()
+             and info.filename.lower().endswith(WORKBOOK_EXTENSIONS + TABLE_EXTENSIONS)
+             and not os.path.basename(info.filename).startswith(('.', '~$'))
+             and not info.filename.startswith('__MACOSX/')),
+            key=lambda info: info.filename
+        )
+        return [(info.filename, archive.read(info)) for info in members]
+
+
+# ===================== NORMALIZATION =====================
+def normalize_frame(df):
+    if DATE_COLUMN in df.columns:
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN], errors='coerce')
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def _union_categoricals(parts, ignore_order=False):
+    # union_categoricals needs one categories dtype, but a part whose values are all
+    # missing has empty float64 categories; such parts become all-missing codes of
+    # the categories the other parts have
+    categories = next((part.categories for part in parts if len(part.categories)), None)
+    if categories is not None:
+        parts = [
+            part if len(part.categories) else pd.Categorical.from_codes(np.full(len(part), -1), categories=categories)
+            for part in parts
+        ]
+    return union_categoricals(parts, ignore_order=ignore_order)
+
+
+# ===================== COMPACT REPRESENTATION =====================
+def memory_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _downcast_integer(series, dtype):
+    values = pd.to_numeric(series, errors='coerce')
+    present = values.dropna()
+    info = np.iinfo(dtype)
+    if present.empty or not (present == present.round()).all():
+        return values
+    if present.min() < info.min or present.max() > info.max:
+        return values
+    return values.astype(dtype if len(present) == len(values) else f"Int{info.bits}")
+
+
+def compact_frame(df):
+    # Working set for the dashboard: only the columns it reads, filter columns as
+    # category, Quantity as int16 (nullable Int16 when values are missing) and
+    # Rating as float32. Total and Tax 5% stay float64 because the exports carry
+    # four decimals, which int64 cents would round away.
+    compact = df[[col for col in DASHBOARD_COLUMNS if col in df.columns]].copy()
+    compact.attrs = dict(df.attrs)
+    if 'Quantity' in compact.columns:
+        compact['Quantity'] = _downcast_integer(compact['Quantity'], np.int16)
+    if 'Rating' in compact.columns:
+        compact['Rating'] = pd.to_numeric(compact['Rating'], errors='coerce').astype('float32')
+    return normalize_frame(compact)
+
+
+def combine_frames(frames):
+    # Stacks compact per-file frames in order. Filter columns are unioned as
+    # categoricals and columns missing from a file are filled with missing values.
+    if len(frames) == 1:
+        return frames[0]
+    columns = [col for col in DASHBOARD_COLUMNS if any(col in frame.columns for frame in frames)]
+    data = {}
+    for col in columns:
+        if col in CATEGORICAL_COLUMNS:
+            # A file without the column, or with the column left blank, adds missing values
+            data[col] = _union_categoricals(
+                [frame[col].array if col in frame.columns else pd.Categorical([None] * len(frame))
+                 for frame in frames],
+                ignore_order=True
+            )
+            continue
+        empty = np.datetime64('NaT', 'ns') if col == DATE_COLUMN else np.nan
+        values = pd.concat(
+            [frame[col] if col in frame.columns else pd.Series(empty, index=range(len(frame)))
+             for frame in frames],
+            ignore_index=True
+        )
+        if col == 'Quantity':
+            values = _downcast_integer(values, np.int16)
+        elif col == 'Rating':
+            values = values.astype('float32')
+        data[col] = values
+    df = pd.DataFrame(data)
+    source_bytes = [frame.attrs.get('source_bytes') for frame in frames]
+    if all(source_bytes):
+        df.attrs['source_bytes'] = sum(source_bytes)
+    return df
+
+
+# ===================== PARSING =====================
+def parse_workbook(data, sheet_name=0):
+    raw = pd.read_excel(BytesIO(data), sheet_name=sheet_name)
+    source_bytes = memory_bytes(raw)
+    df = normalize_frame(raw)
+    df.attrs['source_bytes'] = source_bytes
+    return df
+
+
+def is_xlsx(data):
+    # .xlsx is a zip container; legacy .xls (BIFF) cannot be streamed by openpyxl
+    return data[:4] == b'PK\x03\x04'
+
+
+# ===================== TABLE FORMATS =====================
+# Explicit dtypes for the known CSV columns, so pyarrow does not have to infer them
+CSV_DTYPES = {
+    DATE_COLUMN: 'datetime64[ns]',
+    **{col: 'category' for col in CATEGORICAL_COLUMNS if col != SHEET_COLUMN},
+    **{col: 'float64' for col in NUMERIC_COLUMNS},
+}
+
+
+def file_format(data):
+    # Detected from the content, so cache keys stay plain content hashes
+    if data[:6] == b'ARROW1':
+        return 'feather'
+    if data[:4] == b'PAR1':
+        return 'parquet'
+    if data[:2] == b'\x1f\x8b':
+        return 'csv.gz'
+    if is_xlsx(data) or data[:4] == b'\xd0\xcf\x11\xe0':
+        return 'excel'
+    return 'csv'
+
+
+def read_csv(data, columns=None, compression=None):
+    if columns is not None:
+        header = pd.read_csv(BytesIO(data), nrows=0, compression=compression).columns
+        columns = [col for col in header if col in columns]
+    try:
+        return pd.read_csv(
+            BytesIO(data), engine='pyarrow', usecols=columns, dtype=CSV_DTYPES, compression=compression
+        )
+    except (ValueError, TypeError, pa.ArrowInvalid):
+        # Dates in a format pyarrow cannot cast natively are parsed by normalize_frame
+        dtypes = {col: dtype for col, dtype in CSV_DTYPES.items() if col != DATE_COLUMN}
+        return pd.read_csv(
+            BytesIO(data), engine='pyarrow', usecols=columns, dtype=dtypes, compression=compression
+        )
+
+
+def read_table(data, columns=None):
+    # CSV, gzipped CSV, Parquet or Feather bytes in the same normalized schema as a
+    # parsed workbook. `columns` projects the read; names missing from the file
+    # are ignored.
+    fmt = file_format(data)
+    if fmt in ('parquet', 'feather'):
+        schema = pq.read_schema(BytesIO(data)) if fmt == 'parquet' else pa.ipc.open_file(BytesIO(data)).schema
+        if columns is not None:
+            columns = [col for col in columns if col in schema.names]
+        if fmt == 'parquet':
+            raw = pd.read_parquet(BytesIO(data), columns=columns)
+        else:
+            raw = pd.read_feather(BytesIO(data), columns=columns)
+    elif fmt in ('csv', 'csv.gz'):
+        raw = read_csv(data, columns, 'gzip' if fmt == 'csv.gz' else None)
+    else:
+        raise ValueError("not a CSV, Parquet or Feather file")
+    source_bytes = memory_bytes(raw)
+    df = normalize_frame(raw)
+    df.attrs = {'source_bytes': source_bytes}
+    return df
+
+
+# ===================== STREAMING READER =====================
+def _typed_batch(col, values):
+    if col == DATE_COLUMN:
+        return pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').to_numpy()
+    if col in CATEGORICAL_COLUMNS:
+        return pd.Categorical(values)
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy()
+
+
+def _combine_batches(col, batches):
+    if col in CATEGORICAL_COLUMNS:
+        return _union_categoricals(batches) if batches else pd.Categorical([])
+    return np.concatenate(batches) if batches else np.array([], dtype=float)
+
+
+def stream_workbook(data, columns=DASHBOARD_COLUMNS, batch_rows=STREAM_BATCH_ROWS, progress=None, sheet_name=None):
+    # Reads one sheet (the first by default) row by row in openpyxl read-only mode
+    # and converts every batch of `batch_rows` rows into typed arrays straight away,
+    # so neither the workbook object graph nor a full object-dtype frame is ever
+    # held in memory.
+    workbook = openpyxl.load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0] if sheet_name is None else workbook[sheet_name]
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = {name: i for i, name in enumerate(header) if name in columns}
+        buffers = {col: [] for col in positions}
+        batches = {col: [] for col in positions}
+        n_rows = 0
+
+        def flush():
+            for col, values in buffers.items():
+                if values:
+                    batches[col].append(_typed_batch(col, values))
+                    buffers[col] = []
+            if progress is not None:
+                progress(n_rows, total_rows)
+
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue
+            for col, i in positions.items():
+                buffers[col].append(row[i] if i < len(row) else None)
+            n_rows += 1
+            if n_rows % batch_rows == 0:
+                flush()
+            elif progress is not None and n_rows % STREAM_PROGRESS_ROWS == 0:
+                progress(n_rows, total_rows)
+        flush()
+    finally:
+        workbook.close()
+
+    ordered = [col for col in columns if col in positions]
+    df = pd.DataFrame({col: _combine_batches(col, batches[col]) for col in ordered})
+    return normalize_frame(df)
+
+
+# ===================== PARALLEL PARSING =====================
+def sheet_names(data):
+    # A CSV, Parquet or Feather file has one implicit sheet named after its format
+    fmt = file_format(data)
+    if fmt != 'excel':
+        return [fmt]
+    if is_xlsx(data):
+        workbook = openpyxl.load_workbook(BytesIO(data), read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    return list(pd.ExcelFile(BytesIO(data)).sheet_names)
+
+
+def parse_sheet(data, sheet_name=None, streaming=False, progress=None):
+    # Process-pool task: one sheet of one workbook (None is the first sheet),
+    # returned together with the seconds it took
+    start = time.perf_counter()
+    if file_format(data) != 'excel':
+        # Tables are projected to the dashboard columns; the raw-data table
+        # reads the remaining ones from the source when it needs them
+        df = read_table(data, columns=DASHBOARD_COLUMNS)
+    elif streaming:
+        df = stream_workbook(data, progress=progress, sheet_name=sheet_name)
+    else:
+        df = parse_workbook(data, 0 if sheet_name is None else sheet_name)
+    return df, time.perf_counter() - start
+
+
+def stack_sheets(frames, names):
+    # Aligns the columns of every sheet (missing ones become missing values) and
+    # tags each row with the sheet it came from
+    tagged = [frame.assign(**{SHEET_COLUMN: name}) for frame, name in zip(frames, names)]
+    df = normalize_frame(pd.concat(tagged, ignore_index=True, sort=False))
+    source_bytes = [frame.attrs.get('source_bytes') for frame in frames]
+    if all(source_bytes):
+        df.attrs['source_bytes'] = sum(source_bytes)
+    return df
+
+
+# Pool workers are forked from a fork server (spawned where there is none), never
+# from the app itself: a fork of the multi-threaded Streamlit server (or of a
+# background load thread) can leave the child holding a lock, such as the import
+# or logging lock, that no thread will ever release. The fork server imports this
+# module once, so its workers start without importing pandas again.
+_POOL_START_LOCK = threading.Lock()
+
+
+def _pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+@contextlib.contextmanager
+def _main_hidden():
+    # Spawned and fork-server workers run the parent's __main__ module again before
+    # their first task, which under Streamlit is the dashboard script. They only
+    # need this module, so __main__ has no file or spec while they start (workers
+    # start inside pool.submit).
+    with _POOL_START_LOCK:
+        main = sys.modules['__main__']
+        spec, path = main.__spec__, main.__dict__.pop('__file__', None)
+        main.__spec__ = None
+        try:
+            yield
+        finally:
+            main.__spec__ = spec
+            if path is not None:
+                main.__file__ = path
+
+
+def _cancellable(progress, cancel):
+    # Progress callback that also aborts the parse as soon as `cancel` is set
+    def report(rows, total_rows):
+        if cancel.is_set():
+            raise LoadCancelled()
+        if progress is not None:
+            progress(rows, total_rows)
+    return report
+
+
+def read_workbooks(blobs, streaming=False, all_sheets=False, workers=PARSE_WORKERS,
+                   progress=None, task_progress=None, cancel=None):
+    # One frame per workbook, in order. Every (workbook, sheet) pair is a task; with
+    # more than one task and worker they run concurrently on a process pool.
+    # `progress(rows, total_rows)` is only reported when parsing in this process.
+    # Each frame keeps its (sheet, rows, seconds) timings in attrs['sheet_timings'].
+    # Setting the `cancel` event abandons the parse with LoadCancelled: streamed
+    # sheets stop at the next batch, other sheets once pd.read_excel returns. On
+    # the pool, queued tasks are dropped and running ones finish unobserved.
+    tasks = [
+        (i, sheet_name)
+        for i, data in enumerate(blobs)
+        for sheet_name in (sheet_names(data) if all_sheets else [None])
+    ]
+    results = {}
+    if cancel is not None:
+        progress = _cancellable(progress, cancel)
+    if workers <= 1 or len(tasks) <= 1:
+        for done, (i, sheet_name) in enumerate(tasks, 1):
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled()
+            results[(i, sheet_name)] = parse_sheet(blobs[i], sheet_name, streaming, progress)
+            if task_progress is not None:
+                task_progress(done, len(tasks))
+    else:
+        pool = ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks))), mp_context=_pool_context())
+        try:
+            with _main_hidden():
+                futures = {
+                    pool.submit(parse_sheet, blobs[i], sheet_name, streaming): (i, sheet_name)
+                    for i, sheet_name in tasks
+                }
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(
+                    pending, timeout=CANCEL_POLL_SECONDS if cancel is not None else None,
+                    return_when=FIRST_COMPLETED
+                )
+                if cancel is not None and cancel.is_set():
+                    raise LoadCancelled()
+                for future in finished:
+                    results[futures[future]] = future.result()
+                    if task_progress is not None:
+                        task_progress(len(results), len(tasks))
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+    frames = []
+    for i in range(len(blobs)):
+        names = [sheet_name for j, sheet_name in tasks if j == i]
+        parts = [results[(i, sheet_name)][0] for sheet_name in names]
+        df = stack_sheets(parts, names) if all_sheets else parts[0]
+        df.attrs['sheet_timings'] = [
+            (sheet_name, len(part), seconds)
+            for sheet_name, (part, seconds) in ((name, results[(i, name)]) for name in names)
+        ]
+        frames.append(df)
+    return frames
+
+
+# ===================== PREVIEW =====================
+def preview_frame(data, rows=PREVIEW_ROWS):
+    # First rows of the first sheet with every column as written, read without
+    # parsing the rest of the file
+    fmt = file_format(data)
+    if fmt == 'parquet':
+        batch = next(pq.ParquetFile(BytesIO(data)).iter_batches(batch_size=rows), None)
+        return batch.to_pandas() if batch is not None else pd.DataFrame()
+    if fmt == 'feather':
+        return pa.ipc.open_file(BytesIO(data)).read_all().slice(0, rows).to_pandas()
+    if fmt in ('csv', 'csv.gz'):
+        return pd.read_csv(BytesIO(data), nrows=rows, compression='gzip' if fmt == 'csv.gz' else None)
+    return pd.read_excel(BytesIO(data), nrows=rows)
+
+
+def preview_schema(df):
+    # Column types as inferred from the preview rows
+    return pd.DataFrame({
+        'Column': [str(col) for col in df.columns],
+        'Type': [str(dtype) for dtype in df.dtypes],
+        'Non-null': [int(df[col].notna().sum()) for col in df.columns],
+        'Dashboard': [col in DASHBOARD_COLUMNS for col in df.columns],
+    })
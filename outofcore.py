@@ -0,0 +1,289 @@
+import json
+import os
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from aggregates import DAY, ROWS, count_column, merge_cubes, sum_column
+from storage import DiskStore
+from ingestion import (
+    CATEGORICAL_COLUMNS,
+    DASHBOARD_COLUMNS,
+    DATE_COLUMN,
+    NUMERIC_COLUMNS,
+    file_format,
+    read_workbooks,
+)
+
+try:
+    import duckdb
+except ImportError:  # optional: Arrow compute answers the same queries
+    duckdb = None
+
+# ===================== SETTINGS =====================
+DATASET_DIR = os.environ.get(
+    'SUPERMARKET_DATASET_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'datasets')
+)
+DATASET_MAX_MB = float(os.environ.get('SUPERMARKET_DATASET_MAX_MB', '20480'))
+OUT_OF_CORE_THRESHOLD_BYTES = int(float(os.environ.get('SUPERMARKET_OUT_OF_CORE_MB', '200')) * 1024 * 1024)
+SCAN_BATCH_ROWS = 1_000_000
+
+# Every stored part has the same schema; columns a file lacks are all null and
+# the columns it really has are listed next to the parts
+DATASET_SCHEMA = pa.schema(
+    [(DATE_COLUMN, pa.timestamp('ns'))]
+    + [(col, pa.float64()) for col in NUMERIC_COLUMNS]
+    + [(col, pa.string()) for col in CATEGORICAL_COLUMNS]
+)
+COLUMNS_FILE = '_columns.json'
+
+
+# ===================== BATCH NORMALIZATION =====================
+def _cast_column(col, values):
+    target = DATASET_SCHEMA.field(col).type
+    if pa.types.is_dictionary(values.type):
+        values = values.cast(values.type.value_type)
+    try:
+        return values.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Mixed or oddly formatted values take the same route as the pandas path
+        series = values.to_pandas()
+        if col == DATE_COLUMN:
+            series = pd.to_datetime(series, errors='coerce')
+        elif col in NUMERIC_COLUMNS:
+            series = pd.to_numeric(series, errors='coerce')
+        else:
+            series = series.astype('string')
+        return pa.array(series, type=target, from_pandas=True)
+
+
+def normalize_batch(batch):
+    # Record batch or table -> table in DATASET_SCHEMA
+    columns = []
+    for field in DATASET_SCHEMA:
+        if field.name in batch.schema.names:
+            columns.append(_cast_column(field.name, batch.column(field.name)))
+        else:
+            columns.append(pa.nulls(batch.num_rows, type=field.type))
+    return pa.Table.from_arrays(columns, schema=DATASET_SCHEMA)
+
+
+def source_batches(data, all_sheets=False):
+    # (dashboard columns present, iterator of record batches) of one uploaded file.
+    # Tables are read batch by batch; workbooks are parsed whole, as Excel sheets
+    # are bounded in size anyway.
+    fmt = file_format(data)
+    if fmt == 'parquet':
+        source = pq.ParquetFile(BytesIO(data))
+        present = [col for col in DASHBOARD_COLUMNS if col in source.schema_arrow.names]
+        return present, source.iter_batches(batch_size=SCAN_BATCH_ROWS, columns=present)
+    if fmt == 'feather':
+        source = pa.ipc.open_file(BytesIO(data))
+        present = [col for col in DASHBOARD_COLUMNS if col in source.schema.names]
+        return present, (source.get_batch(i).select(present) for i in range(source.num_record_batches))
+    if fmt in ('csv', 'csv.gz'):
+        def open_reader(convert_options=None):
+            stream = pa.BufferReader(data)
+            if fmt == 'csv.gz':
+                stream = pa.CompressedInputStream(stream, 'gzip')
+            return pacsv.open_csv(stream, convert_options=convert_options)
+
+        header = open_reader().schema.names
+        present = [col for col in DASHBOARD_COLUMNS if col in header]
+        reader = open_reader(pacsv.ConvertOptions(
+            include_columns=present,
+            column_types={col: DATASET_SCHEMA.field(col).type for col in present if col != DATE_COLUMN},
+            timestamp_parsers=[pacsv.ISO8601, '%m/%d/%Y', '%d/%m/%Y'],
+            strings_can_be_null=True,
+        ))
+        return present, iter(reader)
+    frame = read_workbooks([data], all_sheets=all_sheets, workers=1)[0]
+    present = [col for col in DASHBOARD_COLUMNS if col in frame.columns]
+    return present, iter(pa.Table.from_pandas(frame[present], preserve_index=False).to_batches())
+
+
+# ===================== DATASET STORE =====================
+class DatasetStore(DiskStore):
+    # One directory of Parquet parts per uploaded file, named by its cache key,
+    # all in DATASET_SCHEMA. A multi-file dataset is the union of its directories,
+    # so adding a file only writes that file.
+
+    def __init__(self, directory=DATASET_DIR, max_bytes=int(DATASET_MAX_MB * 1024 * 1024)):
+        super().__init__(directory, max_bytes)
+
+    def has(self, key):
+        return os.path.exists(os.path.join(self.path(key), COLUMNS_FILE))
+
+    def put(self, key, data, all_sheets=False):
+        if self.has(key):
+            os.utime(self.path(key))
+            return
+
+        def write(tmp_path):
+            os.makedirs(tmp_path)
+            present, batches = source_batches(data, all_sheets)
+            part = 0
+            for batch in batches:
+                if batch.num_rows:
+                    pq.write_table(normalize_batch(batch), os.path.join(tmp_path, f"part-{part:05d}.parquet"))
+                    part += 1
+            with open(os.path.join(tmp_path, COLUMNS_FILE), 'w') as f:
+                json.dump(present, f)
+
+        try:
+            self.publish(key, write)
+        except OSError:
+            # Another session published the same file first
+            if not self.has(key):
+                raise
+
+    def columns(self, keys):
+        present = set()
+        for key in keys:
+            with open(os.path.join(self.path(key), COLUMNS_FILE)) as f:
+                present.update(json.load(f))
+        return [col for col in DASHBOARD_COLUMNS if col in present]
+
+    def dataset(self, keys):
+        # Parts in upload order, then part order within each file
+        files = [
+            os.path.join(self.path(key), name)
+            for key in keys for name in sorted(os.listdir(self.path(key))) if name.endswith('.parquet')
+        ]
+        return ds.dataset(files, schema=DATASET_SCHEMA, format='parquet')
+
+
+# ===================== PUSHED-DOWN CUBE =====================
+def _cube_frame(table, keys, measures):
+    # Arrow aggregation result -> the pandas cube layout of aggregates.build_cube
+    cube = table.to_pandas()
+    for col in keys:
+        if col != DAY:
+            cube[col] = cube[col].astype('category')
+    if DAY in keys:
+        cube[DAY] = pd.to_datetime(cube[DAY]).astype('datetime64[ns]')
+    cube[ROWS] = cube[ROWS].astype('int64')
+    for col in measures:
+        cube[sum_column(col)] = cube[sum_column(col)].fillna(0).astype('float64')
+        cube[count_column(col)] = cube[count_column(col)].astype('int64')
+    return cube[keys + [ROWS] + [name for col in measures for name in (sum_column(col), count_column(col))]]
+
+
+def _duckdb_cube(dataset, keys, measures):
+    quote = lambda name: '"' + name.replace('"', '""') + '"'
+    select = [quote(col) for col in keys if col != DAY]
+    if DAY in keys:
+        select.append(f"date_trunc('day', {quote(DATE_COLUMN)}) AS {quote(DAY)}")
+    select.append(f"count(*) AS {quote(ROWS)}")
+    for col in measures:
+        select.append(f"coalesce(sum({quote(col)}), 0) AS {quote(sum_column(col))}")
+        select.append(f"count({quote(col)}) AS {quote(count_column(col))}")
+    group_by = " GROUP BY ALL" if keys else ""
+    connection = duckdb.connect()
+    try:
+        connection.register('sales', dataset)
+        result = connection.execute(f"SELECT {', '.join(select)} FROM sales{group_by}").arrow()
+        # DuckDB 1.4 and later return a record batch reader, earlier versions a table
+        return result.read_all() if isinstance(result, pa.RecordBatchReader) else result
+    finally:
+        connection.close()
+
+
+def _arrow_cube(dataset, keys, measures):
+    # Grouped per scanned batch, then the partial cubes are merged
+    aggregations = [(ROWS, 'sum')]
+    renamed = {f"{ROWS}_sum": ROWS}
+    for col in measures:
+        aggregations += [(col, 'sum', pc.ScalarAggregateOptions(min_count=0)), (col, 'count')]
+        renamed[f"{col}_sum"] = sum_column(col)
+        renamed[f"{col}_count"] = count_column(col)
+    columns = [col for col in keys if col != DAY] + measures + ([DATE_COLUMN] if DAY in keys else [])
+
+    partials = []
+    for batch in dataset.to_batches(columns=columns, batch_size=SCAN_BATCH_ROWS):
+        table = pa.Table.from_batches([batch])
+        if DAY in keys:
+            table = table.append_column(DAY, pc.floor_temporal(table[DATE_COLUMN], unit='day'))
+        table = table.append_column(ROWS, pa.repeat(pa.scalar(1, pa.int64()), table.num_rows))
+        grouped = table.group_by(keys).aggregate(aggregations)
+        grouped = grouped.rename_columns([renamed.get(name, name) for name in grouped.schema.names])
+        partials.append(_cube_frame(grouped, keys, measures))
+    if not partials:
+        empty = pa.table(
+            {col: pa.array([], type=pa.timestamp('ns') if col == DAY else pa.string()) for col in keys}
+            | {ROWS: pa.array([], type=pa.int64())}
+            | {name: pa.array([], type=pa.float64()) for name in renamed.values() if name != ROWS}
+        )
+        return _cube_frame(empty, keys, measures)
+    return merge_cubes(partials)
+
+
+def cube_backends():
+    return ['duckdb', 'arrow'] if duckdb is not None else ['arrow']
+
+
+def build_dataset_cube(dataset, columns, backend=None):
+    # Same cube as aggregates.build_cube, aggregated where the rows live: by DuckDB
+    # when it is installed, by Arrow compute over the scanned batches otherwise
+    # (or by the `backend` named). Only the cube cells are ever materialized in pandas.
+    backend = backend or cube_backends()[0]
+    if backend not in cube_backends():
+        raise ValueError(f"cube backend {backend!r} is not available")
+    keys = [col for col in CATEGORICAL_COLUMNS if col in columns]
+    if DATE_COLUMN in columns:
+        keys.append(DAY)
+    measures = [col for col in NUMERIC_COLUMNS if col in columns]
+    if backend == 'duckdb':
+        return _cube_frame(_duckdb_cube(dataset, keys, measures), keys, measures)
+    return _arrow_cube(dataset, keys, measures)
+
+
+# ===================== PUSHED-DOWN FILTERS =====================
+def filter_expression(filters, columns):
+    # The dashboard filters as an Arrow dataset predicate (None when nothing is filtered)
+    expression = None
+    for col, val in filters.items():
+        if col == DATE_COLUMN and isinstance(val, tuple) and len(val) == 2:
+            if DATE_COLUMN not in columns:
+                continue
+            start = pa.scalar(pd.Timestamp(val[0]).to_pydatetime(), pa.timestamp('ns'))
+            end = pa.scalar((pd.Timestamp(val[1]) + pd.Timedelta(days=1)).to_pydatetime(), pa.timestamp('ns'))
+            condition = (ds.field(col) >= start) & (ds.field(col) < end)
+        elif isinstance(val, list) and val and col in columns:
+            condition = ds.field(col).isin([str(v) for v in val])
+        else:
+            continue
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scan_frames(dataset, expression, columns, batch_rows=SCAN_BATCH_ROWS):
+    # Filtered rows as pandas chunks, in file order
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_rows):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def page_frame(dataset, expression, columns, offset, limit):
+    # One page of filtered rows in file order; the scan stops at the page end
+    pages = []
+    skipped = 0
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=max(limit, 65_536)):
+        if skipped + batch.num_rows <= offset:
+            skipped += batch.num_rows
+            continue
+        start = max(offset - skipped, 0)
+        part = batch.slice(start, limit - sum(len(page) for page in pages))
+        pages.append(part.to_pandas())
+        skipped += batch.num_rows
+        if sum(len(page) for page in pages) >= limit:
+            break
+    if not pages:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(pages, ignore_index=True)
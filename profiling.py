@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# ===================== SETTINGS =====================
+PROFILE_HISTORY = int(os.environ.get('SUPERMARKET_PROFILE_HISTORY', '20'))
+PROFILE_LOG = os.environ.get('SUPERMARKET_PROFILE_LOG', '1') != '0'
+PROFILE_MEMORY = os.environ.get('SUPERMARKET_PROFILE_MEMORY', '0') != '0'
+
+# One JSON object per line on stderr, e.g. for a log shipper to scrape
+logger = logging.getLogger('supermarket.profile')
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# ===================== MEMORY TRACING =====================
+# tracemalloc is process-wide: it runs while at least one profile asks for it.
+# Peaks therefore include allocations of other sessions running at the same time,
+# and Arrow buffers (allocated outside the Python allocator) are not seen. A profile
+# releases tracing when it finishes, or when it is garbage collected unfinished
+# (a run that raised, in a session that then closed).
+_trace_lock = threading.Lock()
+_trace_users = 0
+
+
+def _start_tracing():
+    global _trace_users
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _trace_users += 1
+
+
+def _stop_tracing():
+    global _trace_users
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# ===================== RUN PROFILE =====================
+class RunProfile:
+    # Wall time (and optionally peak Python allocation) of every stage of one rerun.
+    # Stages are recorded in order and must not nest: each one resets the
+    # tracemalloc peak. Extra fields (rows_in, rows_out, payload_bytes, ...) are
+    # set on the record the stage yields.
+
+    def __init__(self, label, trace_memory=PROFILE_MEMORY, session=None):
+        self.label = label
+        self.session = session
+        self.trace_memory = trace_memory
+        self.started = datetime.now(timezone.utc)
+        self.stages = []
+        self.finished = False
+        self._start = time.perf_counter()
+        self._release_tracing = None
+        if self.trace_memory:
+            _start_tracing()
+            self._release_tracing = weakref.finalize(self, _stop_tracing)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        record = {'stage': name, **fields}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                record['peak_bytes'] = max(tracemalloc.get_traced_memory()[1] - base, 0)
+            self.stages.append(record)
+
+    def finish(self):
+        if self.finished:
+            return self.summary
+        self.finished = True
+        if self._release_tracing is not None:
+            # Runs _stop_tracing once, and no longer on garbage collection
+            self._release_tracing()
+        self.summary = {
+            'event': 'profile',
+            'label': self.label,
+            'session': self.session,
+            'started': self.started.isoformat(timespec='milliseconds'),
+            'seconds': time.perf_counter() - self._start,
+            'stages': self.stages,
+        }
+        return self.summary
+
+
+def log_profile(summary):
+    if PROFILE_LOG:
+        logger.info(json.dumps(summary, default=str))
+
+
+# ===================== REPORTS =====================
+def stages_frame(summary):
+    stages = summary['stages']
+    frame = pd.DataFrame({
+        'Stage': [record['stage'] for record in stages],
+        'ms': [round(record['seconds'] * 1000, 1) for record in stages],
+        'Peak MB': [round(record['peak_bytes'] / 1024 ** 2, 2) if 'peak_bytes' in record else None for record in stages],
+        'Rows in': pd.array([record.get('rows_in') for record in stages], dtype='Int64'),
+        'Rows out': pd.array([record.get('rows_out') for record in stages], dtype='Int64'),
+        'Payload KB': [round(record['payload_bytes'] / 1024, 1) if 'payload_bytes' in record else None for record in stages],
+    })
+    # Columns no stage reported are left out
+    return frame.dropna(axis=1, how='all')
+
+
+def history_frame(history):
+    return pd.DataFrame({
+        'Run': [summary['label'] for summary in history],
+        'Started': [summary['started'][11:19] for summary in history],
+        'ms': [round(summary['seconds'] * 1000, 1) for summary in history],
+        'Slowest stage': [
+            max(summary['stages'], key=lambda record: record['seconds'])['stage'] if summary['stages'] else None
+            for summary in history
+        ],
+    })
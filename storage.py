@@ -0,0 +1,292 @@
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ===================== SETTINGS =====================
+CACHE_DIR = os.environ.get(
+    'SUPERMARKET_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'workbooks')
+)
+CACHE_MAX_MB = float(os.environ.get('SUPERMARKET_CACHE_MAX_MB', '1024'))
+MAPPED_DIR = os.environ.get(
+    'SUPERMARKET_MAPPED_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'arrow')
+)
+MAPPED_MAX_MB = float(os.environ.get('SUPERMARKET_MAPPED_MAX_MB', '4096'))
+FRAME_CACHE_ENTRIES = int(os.environ.get('SUPERMARKET_FRAME_CACHE_ENTRIES', '8'))
+RESULT_CACHE_MAX_MB = float(os.environ.get('SUPERMARKET_RESULT_CACHE_MAX_MB', '256'))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('SUPERMARKET_RESULT_CACHE_TTL', '3600'))
+
+
+# ===================== IN-MEMORY FRAME CACHE =====================
+class FrameCache:
+    # Process-wide LRU of loaded datasets shared by every session. Frames handed
+    # out are shared, so callers must treat them as read-only.
+
+    def __init__(self, max_entries=FRAME_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            df = self._frames.get(key)
+            if df is not None:
+                self._frames.move_to_end(key)
+            return df
+
+    def put(self, key, df):
+        with self._lock:
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_entries:
+                self._frames.popitem(last=False)
+
+
+# ===================== DISK STORES =====================
+def _remove(path):
+    # File or directory entry; already gone, or still mapped on platforms that
+    # refuse the unlink
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+class DiskStore:
+    # Directory of entries named {key}{suffix}, each a file or a directory of files.
+    # The mtime doubles as the LRU clock: reads touch it, eviction removes the oldest
+    # entries until the directory fits in max_bytes. Entries are written under a
+    # temporary name and published with an atomic rename, so readers never see a
+    # partial one.
+    suffix = ''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def publish(self, key, write):
+        # write(tmp_path) creates the entry; if it or the rename fails, the temporary
+        # entry is removed and the error raised
+        tmp_path = f"{self.path(key)}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self.evict()
+
+    def remove(self, key):
+        _remove(self.path(key))
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.suffix) or entry.name.endswith('.tmp'):
+                continue
+            try:
+                if entry.is_dir():
+                    size = sum(part.stat().st_size for part in os.scandir(entry.path))
+                else:
+                    size = entry.stat().st_size
+                entries.append((entry.stat().st_mtime, size, entry.name))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            while entries and total > self.max_bytes:
+                _, size, name = entries.pop(0)
+                _remove(os.path.join(self.directory, name))
+                total -= size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+# ===================== MEMORY-MAPPED FRAMES =====================
+class MappedFrameStore(DiskStore):
+    # One uncompressed Arrow IPC file per loaded dataset, memory-mapped read-only.
+    # Frames read back wrap the mapped buffers without copying (numeric, date and
+    # categorical codes; nullable integers are the exception), so every session and
+    # every server process mapping the same file shares one set of page-cache pages.
+    # Removing a file that is still mapped leaves existing frames valid.
+    suffix = '.arrow'
+
+    def __init__(self, directory=MAPPED_DIR, max_bytes=int(MAPPED_MAX_MB * 1024 * 1024)):
+        super().__init__(directory, max_bytes)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with pa.memory_map(path, 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)
+        except (FileNotFoundError, OSError, pa.ArrowInvalid):
+            return None
+        # split_blocks keeps one block per column so pandas does not consolidate
+        # (copy) same-dtype columns into a 2D array
+        return table.to_pandas(split_blocks=True)
+
+    def put(self, key, df):
+        def write(tmp_path):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        try:
+            self.publish(key, write)
+        except Exception:
+            # Columns pyarrow cannot encode (mixed object types) stay in process memory
+            return False
+        return True
+
+    def share(self, key, df):
+        # Persists the frame and hands back its memory-mapped twin; the private
+        # copy is dropped by the caller. Falls back to `df` if it cannot be written.
+        if not self.put(key, df):
+            return df
+        mapped = self.get(key)
+        return df if mapped is None else mapped
+
+
+# ===================== PARQUET CACHE =====================
+class ParquetCache(DiskStore):
+    # One Parquet file per parsed workbook, named by content hash
+    suffix = '.parquet'
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        super().__init__(directory, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest, columns=None):
+        # `columns` projects the read; names missing from the file are ignored
+        path = self.path(digest)
+        try:
+            if columns is not None:
+                available = set(pq.read_schema(path).names)
+                columns = [col for col in columns if col in available]
+            df = pd.read_parquet(path, columns=columns)
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, digest, df):
+        try:
+            self.publish(digest, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+        except Exception:
+            # Columns pyarrow cannot encode (mixed object types) just skip the cache
+            return False
+        return True
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                **stats,
+            }
+
+
+# ===================== RESULT CACHE =====================
+def estimate_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    # Process-wide memo of small computed results (chart tables, KPIs) shared by
+    # every session. Entries expire after ttl seconds and the least recently used
+    # ones are dropped once the total estimated size exceeds max_bytes.
+    # Cached values are shared, so callers must treat them as read-only.
+
+    def __init__(self, max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024), ttl=RESULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self.bytes -= nbytes
+
+    def get_or_compute(self, key, compute, size=estimate_nbytes):
+        # `size` estimates the bytes of a computed value for the max_bytes budget
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+
+        value = compute()
+        nbytes = size(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, nbytes, now + self.ttl)
+            self.bytes += nbytes
+            expired = [k for k, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+            for k in expired:
+                self._drop(k)
+            while self._entries and self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -1,8 +1,94 @@
+import functools
+import os
+import threading
+import uuid
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+from collections import deque
 from io import BytesIO
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Column selections and row slices share memory until written to
+pd.set_option("mode.copy_on_write", True)
+
+from ingestion import (
+    CATEGORICAL_COLUMNS,
+    DASHBOARD_COLUMNS,
+    PARSE_WORKERS,
+    LoadCancelled,
+    STREAMING_THRESHOLD_BYTES,
+    combine_frames,
+    compact_frame,
+    dataset_digest,
+    expand_upload,
+    file_digest,
+    file_format,
+    is_xlsx,
+    memory_bytes,
+    preview_frame,
+    preview_schema,
+    read_table,
+    read_workbooks,
+    sheet_names,
+    stack_sheets,
+)
+from storage import FrameCache, MappedFrameStore, ParquetCache, ResultCache
+from filters import BitmapIndex, DateIndex, IncrementalFilter
+from export import EXPORT_CACHE_MAX_MB, EXPORT_FORMATS, export_bytes, export_frames
+from outofcore import (
+    OUT_OF_CORE_THRESHOLD_BYTES,
+    DatasetStore,
+    build_dataset_cube,
+    filter_expression,
+    page_frame,
+    scan_frames,
+)
+from table_view import (
+    DEFAULT_PAGE_SIZE,
+    PAGE_SIZES,
+    page_count,
+    page_window,
+    search_mask,
+    sort_order,
+    visible_positions,
+)
+from charts import (
+    DEFAULT_POINT_BUDGET,
+    DEFAULT_TOP_N,
+    WEBGL_THRESHOLD,
+    downsample_line,
+    figure_payload_bytes,
+    top_n_with_other,
+)
+from profiling import (
+    PROFILE_HISTORY,
+    PROFILE_MEMORY,
+    RunProfile,
+    history_frame,
+    log_profile,
+    stages_frame,
+)
+from engine import compute_insights, compute_kpis
+from background import BACKGROUND_GRACE_SECONDS, BACKGROUND_POLL_SECONDS, BACKGROUND_THRESHOLD_BYTES, LoadJob
+from aggregates import (
+    DAY,
+    DEFAULT_GRANULARITY,
+    GRANULARITIES,
+    PERIOD,
+    ROWS,
+    build_cube,
+    city_rating_data,
+    merge_cubes,
+    dashboard_plan,
+    filter_state,
+    payment_counts_data,
+    product_qty_data,
+    product_sales_data,
+    sales_trend_data,
+    slice_cube,
+)
 
 # ===================== PAGE CONFIG =====================
 st.set_page_config(
@@ -45,6 +131,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Sales After Tax",
         "kpi_rating_avg": "Average Rating",
         "monthly_sales": "Monthly Sales Trend",
+        "sales_trend": "Sales Trend",
         "products_sold": "Products Sold",
         "sales_by_product": "Sales by Product Line",
         "payment_methods": "Payment Methods",
@@ -71,6 +158,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Penjualan Setelah Pajak",
         "kpi_rating_avg": "Rata-rata Rating",
         "monthly_sales": "Tren Penjualan Bulanan",
+        "sales_trend": "Tren Penjualan",
         "products_sold": "Produk Terjual",
         "sales_by_product": "Penjualan per Produk",
         "payment_methods": "Metode Pembayaran",
@@ -97,6 +185,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "税后销售额",
         "kpi_rating_avg": "平均评分",
         "monthly_sales": "月度销售趋势",
+        "sales_trend": "销售趋势",
         "products_sold": "已售产品",
         "sales_by_product": "按产品线销售",
         "payment_methods": "支付方式",
@@ -123,6 +212,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "税引後売上",
         "kpi_rating_avg": "平均評価",
         "monthly_sales": "月次売上トレンド",
+        "sales_trend": "売上トレンド",
         "products_sold": "販売商品",
         "sales_by_product": "商品別売上",
         "payment_methods": "支払方法",
@@ -149,6 +239,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "세후 매출",
         "kpi_rating_avg": "평균 평점",
         "monthly_sales": "월간 판매 추세",
+        "sales_trend": "판매 추세",
         "products_sold": "판매된 제품",
         "sales_by_product": "제품 라인별 매출",
         "payment_methods": "결제 방법",
@@ -175,6 +266,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Vendite Dopo Tasse",
         "kpi_rating_avg": "Valutazione Media",
         "monthly_sales": "Andamento Vendite Mensili",
+        "sales_trend": "Andamento Vendite",
         "products_sold": "Prodotti Venduti",
         "sales_by_product": "Vendite per Linea Prodotto",
         "payment_methods": "Metodi di Pagamento",
@@ -201,6 +293,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Umsatz nach Steuern",
         "kpi_rating_avg": "Durchschnittliche Bewertung",
         "monthly_sales": "Monatlicher Umsatzverlauf",
+        "sales_trend": "Umsatzverlauf",
         "products_sold": "Verkaufte Produkte",
         "sales_by_product": "Umsatz nach Produktlinie",
         "payment_methods": "Zahlungsmethoden",
@@ -227,6 +320,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Ventes Après Taxes",
         "kpi_rating_avg": "Note Moyenne",
         "monthly_sales": "Tendance des Ventes Mensuelles",
+        "sales_trend": "Tendance des Ventes",
         "products_sold": "Produits Vendus",
         "sales_by_product": "Ventes par Ligne de Produit",
         "payment_methods": "Modes de Paiement",
@@ -253,6 +347,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Verkoop na Belasting",
         "kpi_rating_avg": "Gemiddelde Beoordeling",
         "monthly_sales": "Maandelijkse Verkooptrend",
+        "sales_trend": "Verkooptrend",
         "products_sold": "Verkochte Producten",
         "sales_by_product": "Verkoop per Productlijn",
         "payment_methods": "Betalingsmethoden",
@@ -279,6 +374,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "المبيعات بعد الضريبة",
         "kpi_rating_avg": "متوسط التقييم",
         "monthly_sales": "اتجاه المبيعات الشهرية",
+        "sales_trend": "اتجاه المبيعات",
         "products_sold": "المنتجات المباعة",
         "sales_by_product": "المبيعات حسب خط الإنتاج",
         "payment_methods": "طرق الدفع",
@@ -305,6 +401,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Ventas Después de Impuestos",
         "kpi_rating_avg": "Calificación Promedio",
         "monthly_sales": "Tendencia de Ventas Mensuales",
+        "sales_trend": "Tendencia de Ventas",
         "products_sold": "Productos Vendidos",
         "sales_by_product": "Ventas por Línea de Producto",
         "payment_methods": "Métodos de Pago",
@@ -331,6 +428,7 @@ TRANSLATIONS = {
         "kpi_sales_after_tax": "Vendas Após Impostos",
         "kpi_rating_avg": "Avaliação Média",
         "monthly_sales": "Tendência de Vendas Mensais",
+        "sales_trend": "Tendência de Vendas",
         "products_sold": "Produtos Vendidos",
         "sales_by_product": "Vendas por Linha de Produto",
         "payment_methods": "Métodos de Pagamento",
@@ -426,7 +524,253 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ===================== PROFILING =====================
+# Every full run records its stages in a fresh profile; a fragment rerun records
+# its own (see profiled_fragment). Finished profiles are written to the JSON log and
+# kept in a rolling per-session history shown in the Performance panel.
+profile_history = st.session_state.setdefault("profile_history", deque(maxlen=PROFILE_HISTORY))
+profile_session = st.session_state.setdefault("profile_session", uuid.uuid4().hex[:8])
+
+def new_profile(label):
+    # A run that stopped early never finished its profile; release it first
+    stale = st.session_state.get("profile")
+    if stale is not None and not stale.finished:
+        stale.finish()
+    trace_memory = PROFILE_MEMORY or st.session_state.get("show_performance", False)
+    profile = RunProfile(label, trace_memory, profile_session)
+    st.session_state["profile"] = profile
+    return profile
+
+def finish_profile(profile, history):
+    if profile.finished:
+        return profile.summary
+    summary = profile.finish()
+    log_profile(summary)
+    history.append(summary)
+    return summary
+
+def stage(name, **fields):
+    return st.session_state["profile"].stage(name, **fields)
+
+def stop_run():
+    # st.stop() for a full run that ends early: its profile is finished first, so
+    # it is logged and stops holding tracemalloc if the session closes now
+    finish_profile(st.session_state["profile"], profile_history)
+    st.stop()
+
+def profiled_fragment(label):
+    # st.fragment that records into the running profile during a full run and
+    # into a profile of its own when only the fragment reruns
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            profile = st.session_state.get("profile")
+            if profile is not None and not profile.finished:
+                return func(*args, **kwargs)
+            profile = new_profile(label)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                finish_profile(profile, st.session_state["profile_history"])
+        return st.fragment(run)
+    return decorate
+
+new_profile("rerun")
+
+# ===================== DATA LOADING =====================
+@st.cache_resource
+def get_disk_cache():
+    return ParquetCache()
+
+@st.cache_resource
+def get_frame_cache():
+    return FrameCache()
+
+@st.cache_resource
+def get_mapped_store():
+    return MappedFrameStore()
+
+@st.cache_resource
+def get_cube_cache():
+    return FrameCache()
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+@st.cache_resource
+def get_export_cache():
+    return ResultCache(max_bytes=int(EXPORT_CACHE_MAX_MB * 1024 * 1024))
+
+@st.cache_resource
+def get_dataset_store():
+    return DatasetStore()
+
+def load_files(files, streaming=False, all_sheets=False, workers=PARSE_WORKERS,
+               progress=None, task_progress=None, cancel=None):
+    # One compact frame per (key, bytes) file, in order: shared memory -> Arrow memory
+    # map -> Parquet on disk -> workbook. Only files missing from every cache are
+    # parsed, all of them (and all their sheets) in one process-pool batch. Disk keeps
+    # every column; memory only holds the compact dashboard columns, backed by the
+    # memory-mapped file so sessions and server processes share the same pages.
+    frame_cache, disk_cache, mapped_store = get_frame_cache(), get_disk_cache(), get_mapped_store()
+    frames = {}
+    missing = []
+    for key, data in files:
+        df = frame_cache.get(key)
+        if df is None:
+            df = mapped_store.get(key)
+            if df is None:
+                df = disk_cache.get(key, columns=DASHBOARD_COLUMNS)
+                if df is None:
+                    missing.append((key, data))
+                    continue
+                df = mapped_store.share(key, compact_frame(df))
+            frame_cache.put(key, df)
+        frames[key] = df
+    if missing:
+        parsed = read_workbooks(
+            [data for _, data in missing], streaming, all_sheets, workers, progress, task_progress, cancel
+        )
+        for (key, _), df in zip(missing, parsed):
+            disk_cache.put(key, df)
+            df = mapped_store.share(key, compact_frame(df))
+            frame_cache.put(key, df)
+            frames[key] = df
+    return [frames[key] for key, _ in files]
+
+def read_upload(files, out_of_core=False, streaming=False, all_sheets=False, workers=PARSE_WORKERS,
+                progress=None, task_progress=None, cancel=None):
+    # The slow part of loading an upload, which may run off the script thread:
+    # per-file frames, or nothing out of core, where the files go into the dataset store
+    if not out_of_core:
+        return load_files(files, streaming, all_sheets, workers, progress, task_progress, cancel)
+    store = get_dataset_store()
+    for done, (key, data) in enumerate(files, 1):
+        if cancel is not None and cancel.is_set():
+            raise LoadCancelled()
+        store.put(key, data, all_sheets)
+        if task_progress is not None:
+            task_progress(done, len(files))
+    return []
+
+def background_load(ctx, files, out_of_core, streaming, all_sheets, workers, job):
+    # LoadJob target: a preview of the first file, then read_upload with its
+    # progress reported to the job. The thread carries the session's script context
+    # for the cached stores; it never writes to the page.
+    add_script_run_ctx(threading.current_thread(), ctx)
+    job.report(0.0, "Reading preview...")
+    job.preview = preview_frame(files[0][1])
+    
+    def report_progress(rows, total_rows):
+        job.report(rows / total_rows if total_rows else 0.0, f"Reading rows... {rows:,}")
+    
+    def report_sheets(done, total):
+        job.report(done / total, f"Reading sheets... {done} / {total}")
+    
+    job.report(0.0, "Reading files...")
+    return read_upload(
+        files, out_of_core, streaming, all_sheets, workers, report_progress, report_sheets, job.cancel_event
+    )
+
+def load_dataset(keys, frames):
+    # Per-file frames stacked into one dataset. A dataset extending a cached one by
+    # a file appends that file's rows to the cached prefix; any other is stacked in
+    # one pass, so no prefix dataset is ever built. The stacked frame is
+    # memory-mapped like the single-file ones and replaces the mapped file of its
+    # prefix, if any (sessions still using that prefix keep their mapping).
+    if len(keys) == 1:
+        return frames[0]
+    frame_cache, mapped_store = get_frame_cache(), get_mapped_store()
+    key = dataset_digest(keys)
+    df = frame_cache.get(key)
+    if df is None:
+        df = mapped_store.get(key)
+        if df is None:
+            prefix = frame_cache.get(dataset_digest(keys[:-1]))
+            df = combine_frames(frames if prefix is None else [prefix, frames[-1]])
+            df = mapped_store.share(key, df)
+            if len(keys) > 2:
+                mapped_store.remove(dataset_digest(keys[:-1]))
+        frame_cache.put(key, df)
+    return df
+
+def load_full_data(files, all_sheets=False):
+    # Every workbook column of every file, loaded only when the raw-data table asks for it
+    frame_cache = get_frame_cache()
+    key = dataset_digest([key for key, _ in files]) + "-full"
+    full = frame_cache.get(key)
+    if full is None:
+        parts = []
+        for file_key, data in files:
+            if file_format(data) != 'excel':
+                # Only the dashboard columns of a table are cached; it is cheap to re-read
+                part = read_table(data)
+                parts.append(stack_sheets([part], sheet_names(data)) if all_sheets else part)
+                continue
+            part = get_disk_cache().get(file_key)
+            parts.append(part if part is not None else read_workbooks([data], all_sheets=all_sheets)[0])
+        full = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+        frame_cache.put(key, full)
+    return full
+
+def load_cube(keys, frames):
+    # Aggregate cube built once per dataset; every KPI and chart reads from it.
+    # A dataset extending a cached one by a file only builds the new file's cube
+    # and merges it into the cached cube of the prefix; any other merges the cubes
+    # of all its files at once.
+    cube_cache = get_cube_cache()
+    key = dataset_digest(keys)
+    cube = cube_cache.get(key)
+    if cube is None:
+        prefix = cube_cache.get(dataset_digest(keys[:-1])) if len(keys) > 1 else None
+        if prefix is None:
+            cube = merge_cubes([build_cube(frame) for frame in frames])
+        else:
+            cube = merge_cubes([prefix, build_cube(frames[-1])])
+        cube_cache.put(key, cube)
+    return cube
+
+def load_store_cube(keys):
+    # Out-of-core counterpart of load_cube: the cube is aggregated inside the
+    # dataset store, over every file at once or over the new file only when the
+    # cube of the prefix is cached
+    cube_cache, store = get_cube_cache(), get_dataset_store()
+    key = dataset_digest(keys) + "-ooc"
+    cube = cube_cache.get(key)
+    if cube is None:
+        prefix = cube_cache.get(dataset_digest(keys[:-1]) + "-ooc") if len(keys) > 1 else None
+        if prefix is None:
+            cube = build_dataset_cube(store.dataset(keys), store.columns(keys))
+        else:
+            cube = merge_cubes([prefix, build_dataset_cube(store.dataset(keys[-1:]), store.columns(keys[-1:]))])
+        cube_cache.put(key, cube)
+    return cube
+
+@st.cache_resource(max_entries=8)
+def load_bitmap_index(key, _df):
+    return BitmapIndex(_df)
+
+@st.cache_resource(max_entries=8)
+def load_date_index(key, _df):
+    return DateIndex(_df['Date']) if 'Date' in _df.columns else None
+
+@st.cache_resource(max_entries=16)
+def load_sort_order(key, column, ascending, _df):
+    return sort_order(_df, column, ascending)
+
 # ===================== SIDEBAR =====================
+df = None
+cube = None
+data_key = None
+data_columns = None
+n_rows = 0
+date_index = None
+file_keys = ()
+file_frames = []
+files = []
+loading_job = None
+
 with st.sidebar:
     # Language selection
     lang_options = list(TRANSLATIONS.keys())
@@ -439,7 +783,12 @@ with st.sidebar:
     
     # File upload
     st.markdown(f"## 📁 {tr['upload']}")
-    uploaded_file = st.file_uploader(tr["upload"], type=["xlsx", "xls"], label_visibility="collapsed")
+    uploaded_files = st.file_uploader(
+        tr["upload"],
+        type=["xlsx", "xls", "csv", "gz", "parquet", "feather", "zip"],
+        accept_multiple_files=True,
+        label_visibility="collapsed"
+    )
     
     st.markdown("---")
     
@@ -448,36 +797,189 @@ with st.sidebar:
     
     filter_widgets = {}
     
-    if uploaded_file:
+    if uploaded_files:
         try:
-            df = pd.read_excel(uploaded_file)
+            # Zip archives expand to their workbooks; a file uploaded twice counts once.
+            # Expansion and hashing are memoized per uploaded file, so reruns that keep
+            # the upload (language, filters) skip them.
+            upload_memo = st.session_state.get("upload_memo", {})
+            upload_memo = {
+                uploaded.file_id: upload_memo.get(uploaded.file_id) or [
+                    (file_digest(data), data)
+                    for _, data in expand_upload(uploaded.name, uploaded.getvalue())
+                ]
+                for uploaded in uploaded_files
+            }
+            st.session_state["upload_memo"] = upload_memo
+            seen = set()
+            for uploaded in uploaded_files:
+                for digest, data in upload_memo[uploaded.file_id]:
+                    if digest not in seen:
+                        seen.add(digest)
+                        files.append((digest, data))
+            if not files:
+                raise ValueError("no workbooks or tables found in the upload")
             
-            # Create filters for categorical columns
-            categorical_cols = ['Branch', 'City', 'Customer type', 'Gender', 'Product line', 'Payment']
+            out_of_core = st.toggle(
+                "🗄 Out-of-core mode",
+                value=sum(len(data) for _, data in files) >= OUT_OF_CORE_THRESHOLD_BYTES,
+                help="Keeps the rows in a Parquet dataset on disk and answers every KPI, chart "
+                     "and filter with aggregation queries over it"
+            )
+            streaming = not out_of_core and all(is_xlsx(data) for _, data in files) and st.toggle(
+                "⚡ Streaming mode (large workbooks)",
+                value=sum(len(data) for _, data in files) >= STREAMING_THRESHOLD_BYTES,
+                help="Reads the workbook in batches and keeps only the columns the dashboard uses"
+            )
             
-            for col in categorical_cols:
-                if col in df.columns:
-                    unique_vals = df[col].dropna().unique().tolist()
-                    if len(unique_vals) > 0:
-                        selected = st.multiselect(f"{col} Filter", options=unique_vals, default=unique_vals)
-                        filter_widgets[col] = selected
+            all_sheets = st.toggle(
+                "📑 Read all sheets",
+                help="Reads every sheet of every workbook and tags each row with its sheet name"
+            )
+            parse_workers = st.number_input(
+                "Parser processes",
+                min_value=1,
+                max_value=max(PARSE_WORKERS, os.cpu_count() or 1),
+                value=PARSE_WORKERS,
+                help="Sheets and files that are not cached yet are parsed in parallel"
+            )
             
-            # Date filter
-            if 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-                min_date = df['Date'].min().date()
-                max_date = df['Date'].max().date()
-                date_range = st.date_input(
-                    tr["date_range"],
-                    (min_date, max_date),
-                    min_value=min_date,
-                    max_value=max_date
-                )
-                if len(date_range) == 2:
-                    filter_widgets['Date'] = date_range
+            progress_bar = st.empty()
+            
+            def report_progress(rows, total_rows):
+                fraction = min(rows / total_rows, 1.0) if total_rows else 0.0
+                progress_bar.progress(fraction, text=f"Reading rows... {rows:,}")
+            
+            def report_sheets(done, total):
+                progress_bar.progress(done / total, text=f"Reading sheets... {done} / {total}")
+            
+            suffix = ("-stream" if streaming else "") + ("-sheets" if all_sheets else "")
+            files = [(digest + suffix, data) for digest, data in files]
+            file_keys = tuple(key for key, _ in files)
+            data_key = dataset_digest(file_keys)
+            
+            # Uploads large enough to keep the page waiting load on a background thread
+            # while the loading screen shows progress and a preview. A changed upload
+            # cancels the load still running for the previous one.
+            load_key = data_key + ("-ooc" if out_of_core else "")
+            load_job = st.session_state.get("load_job")
+            if load_job is not None and load_job.key != load_key:
+                load_job.cancel()
+                load_job = None
+            if load_job is None and sum(len(data) for _, data in files) >= BACKGROUND_THRESHOLD_BYTES:
+                load_job = LoadJob(load_key, functools.partial(
+                    background_load, get_script_run_ctx(), files, out_of_core, streaming, all_sheets, parse_workers
+                ))
+            st.session_state["load_job"] = load_job
+            
+            with stage("load") as record:
+                if load_job is None:
+                    file_frames = read_upload(
+                        files, out_of_core, streaming, all_sheets, parse_workers, report_progress, report_sheets
+                    )
+                else:
+                    # Cached files finish within the grace time and skip the loading screen
+                    load_job.wait(BACKGROUND_GRACE_SECONDS)
+                    if load_job.state == 'failed':
+                        raise load_job.error
+                    if load_job.state != 'done':
+                        loading_job = load_job
+                    file_frames = load_job.result or []
+                if loading_job is None:
+                    if out_of_core:
+                        # Only files new to the store were converted; no rows stay in memory
+                        data_columns = get_dataset_store().columns(file_keys)
+                        cube = load_store_cube(file_keys)
+                        n_rows = int(cube[ROWS].sum())
+                    else:
+                        df = load_dataset(file_keys, file_frames)
+                        data_columns = list(df.columns)
+                        n_rows = len(df)
+                    record["rows_out"] = n_rows
+            progress_bar.empty()
+            if loading_job is None and (len(files) > 1 or out_of_core):
+                st.caption(f"📚 {len(files)} files · {n_rows:,} rows")
+            
+            # Timings are recorded when a file is parsed and kept with its cached copy
+            timings = [
+                (n, sheet_name or "(first sheet)", rows, seconds)
+                for n, frame in enumerate(file_frames, 1)
+                for sheet_name, rows, seconds in frame.attrs.get('sheet_timings', [])
+            ]
+            if timings:
+                with st.expander(f"⏱ Parse timings ({parse_workers} processes)"):
+                    st.dataframe(
+                        pd.DataFrame(timings, columns=['File', 'Sheet', 'Rows', 'Seconds']),
+                        hide_index=True
+                    )
+            
+            if data_columns is not None:
+                if cube is None:
+                    with stage("cube"):
+                        cube = load_cube(file_keys, file_frames)
+                
+                # Create filters for categorical columns from the cube cells rather than the
+                # rows (same values, in order of first appearance)
+                for col in CATEGORICAL_COLUMNS:
+                    if col in data_columns:
+                        unique_vals = cube[col].dropna().unique().tolist()
+                        if len(unique_vals) > 0:
+                            selected = st.multiselect(f"{col} Filter", options=unique_vals, default=unique_vals)
+                            filter_widgets[col] = selected
+                
+                # Date filter
+                if out_of_core:
+                    days = cube[DAY].dropna() if DAY in cube.columns else pd.Series(dtype='datetime64[ns]')
+                    date_bounds = (days.min(), days.max()) if not days.empty else None
+                else:
+                    date_index = load_date_index(data_key, df)
+                    date_bounds = date_index.bounds() if date_index is not None else None
+                if date_bounds is not None:
+                    min_date = date_bounds[0].date()
+                    max_date = date_bounds[1].date()
+                    date_range = st.date_input(
+                        tr["date_range"],
+                        (min_date, max_date),
+                        min_value=min_date,
+                        max_value=max_date
+                    )
+                    if len(date_range) == 2:
+                        filter_widgets['Date'] = date_range
                     
         except Exception as e:
             st.error(f"Error reading file: {e}")
+        
+        cache_stats = get_disk_cache().stats()
+        st.caption(
+            f"💾 Disk cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}) · {cache_stats['files']} files · "
+            f"{cache_stats['bytes'] / 1024 ** 2:,.1f} / {cache_stats['max_bytes'] / 1024 ** 2:,.0f} MB"
+        )
+        mapped_stats = get_mapped_store().stats()
+        st.caption(
+            f"🗺 Shared memory map: {mapped_stats['files']} files · "
+            f"{mapped_stats['bytes'] / 1024 ** 2:,.1f} / {mapped_stats['max_bytes'] / 1024 ** 2:,.0f} MB"
+        )
+        if df is not None:
+            source_bytes = df.attrs.get('source_bytes')
+            compact_bytes = memory_bytes(df)
+            if source_bytes:
+                st.caption(
+                    f"🗜 Memory: {source_bytes / 1024 ** 2:,.1f} MB → {compact_bytes / 1024 ** 2:,.1f} MB "
+                    f"({1 - compact_bytes / source_bytes:.0%} smaller)"
+                )
+            else:
+                st.caption(f"🗜 Memory: {compact_bytes / 1024 ** 2:,.1f} MB")
+        result_stats_slot = st.empty()
+
+        payload_slot = st.empty()
+    show_performance = st.toggle(
+        "⏱ Performance",
+        key="show_performance",
+        help="Per-stage timings, peak memory, row counts and chart payloads of this run "
+             f"and the last {PROFILE_HISTORY} runs"
+    )
+    performance_panel = st.container()
     
     st.markdown("---")
     st.markdown(f"### ℹ {tr['instructions']}")
@@ -504,299 +1006,509 @@ st.markdown(
 # ===================== MAIN HEADER =====================
 st.markdown(f'<div class="main-header"><h1 style="margin:0;">🛒 {tr["title"]}</h1><p style="margin:0; opacity:0.95;">{tr["subtitle"]}</p></div>', unsafe_allow_html=True)
 
-if not uploaded_file:
+if not uploaded_files:
+    # A load still running for a removed upload is abandoned
+    if st.session_state.get("load_job") is not None:
+        st.session_state.pop("load_job").cancel()
     st.info(tr["no_data"])
-    st.stop()
+    stop_run()
 
-# ===================== DATA LOADING =====================
-@st.cache_data
-def load_data(file):
-    return pd.read_excel(file)
+# ===================== BACKGROUND LOAD =====================
+@st.fragment(run_every=BACKGROUND_POLL_SECONDS)
+def loading_section(job):
+    # Polls the load: progress, a cancel button and the preview while it runs, then
+    # a full rerun to build the dashboard from the result
+    if not job.running:
+        st.rerun()
+    st.progress(job.fraction, text=f"{job.text or 'Loading...'} · {job.seconds:,.0f} s")
+    if job.cancelling:
+        st.info("Cancelling... the sheet being read is finished first.")
+    elif st.button("✖ Cancel loading"):
+        job.cancel()
+        job.wait(BACKGROUND_GRACE_SECONDS)
+        st.rerun()
+    
+    if job.preview is not None:
+        preview_col, schema_col = st.columns([3, 2])
+        with preview_col:
+            st.markdown(f"**👀 Preview · first {len(job.preview):,} rows**")
+            st.dataframe(job.preview, hide_index=True, height=360)
+        with schema_col:
+            st.markdown("**🧬 Schema**")
+            st.dataframe(preview_schema(job.preview), hide_index=True, height=360)
 
-df = load_data(uploaded_file)
+if loading_job is not None:
+    if loading_job.running:
+        loading_section(loading_job)
+    else:
+        st.warning("Loading cancelled.")
+        if st.button("🔁 Load again"):
+            st.session_state.pop("load_job")
+            st.rerun()
+    stop_run()
 
-# ===================== APPLY FILTERS =====================
-df_filtered = df.copy()
-
-for col, val in filter_widgets.items():
-    if col not in df_filtered.columns:
-        continue
-    if isinstance(val, list):
-        if val:
-            df_filtered = df_filtered[df_filtered[col].isin(val)]
-    elif isinstance(val, tuple) and len(val) == 2 and col == 'Date':
-        start_date, end_date = pd.to_datetime(val[0]), pd.to_datetime(val[1])
-        if 'Date' in df_filtered.columns:
-            df_filtered['Date'] = pd.to_datetime(df_filtered['Date'], errors='coerce')
-            df_filtered = df_filtered[(df_filtered['Date'] >= start_date) & (df_filtered['Date'] <= end_date)]
+# A file that failed to load (or whose cube failed to build) has been reported above
+if data_columns is None or cube is None:
+    stop_run()
 
-# ===================== KPI CALCULATIONS =====================
-total_sales = df_filtered['Total'].sum() if 'Total' in df_filtered.columns else 0
-total_quantity = df_filtered['Quantity'].sum() if 'Quantity' in df_filtered.columns else 0
-average_rating = df_filtered['Rating'].mean() if 'Rating' in df_filtered.columns else 0
-
-# Sales after tax = Total - Tax
-if 'Total' in df_filtered.columns and 'Tax 5%' in df_filtered.columns:
-    total_tax = df_filtered['Tax 5%'].sum()
-    sales_after_tax = total_sales - total_tax
-else:
-    sales_after_tax = None
-
-# ===================== KPI DISPLAY IN BOXES =====================
-st.markdown("## 📊 " + tr["data_overview"])
-
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    st.markdown(
-        f"""
-        <div class="kpi-box">
-            <div class="kpi-label">{tr["kpi_total_sales"]}</div>
-            <div class="kpi-value">${total_sales:,.2f}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+# ===================== APPLY FILTERS =====================
+# KPIs, charts and insights are answered from the cube cells matching the current
+# filters, so a rerun touches no row-level data unless the raw-data table is shown.
+# Every aggregate the page needs is computed by one planned pass per dimension and
+# shared across sessions, keyed by dataset and normalized filters.
+result_cache = get_result_cache()
+result_key = (data_key, filter_state(cube, filter_widgets))
 
-with col2:
-    st.markdown(
-        f"""
-        <div class="kpi-box">
-            <div class="kpi-label">{tr["kpi_products_sold"]}</div>
-            <div class="kpi-value">{total_quantity:,.0f}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
+with stage("filter", rows_in=n_rows) as record:
+    aggregates = result_cache.get_or_compute(
+        result_key + ("aggregates",),
+        lambda: dashboard_plan().execute(slice_cube(cube, filter_widgets))
     )
+    record["rows_out"] = int(aggregates[(None, None, 'count')])
 
-with col3:
-    sales_after_tax_display = f"${sales_after_tax:,.2f}" if sales_after_tax is not None else "N/A"
-    st.markdown(
-        f"""
-        <div class="kpi-box">
-            <div class="kpi-label">{tr["kpi_sales_after_tax"]}</div>
-            <div class="kpi-value">{sales_after_tax_display}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+# Each section below is a function of the data it reads. Sections with their own
+# widgets are fragments: a change to one of those widgets reruns that section only.
+# Everything else (language, uploads, filters) reruns the page, which then mostly
+# replays cached aggregates and figures.
+def chart_data(result_key, aggregates, name, compute):
+    return get_result_cache().get_or_compute(result_key + (name,), lambda: compute(aggregates))
 
-with col4:
-    rating_display = f"{average_rating:.1f}" if 'Rating' in df_filtered.columns else "N/A"
-    st.markdown(
-        f"""
-        <div class="kpi-box">
-            <div class="kpi-label">{tr["kpi_rating_avg"]}</div>
-            <div class="kpi-value">{rating_display}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+def show_chart(result_key, name, options, build):
+    # Figures depend on the filtered data and the chart's own options only, never on
+    # the language, so each one is built once and shared across sessions
+    def render():
+        fig = build()
+        return fig, figure_payload_bytes(fig)
+    
+    with stage(name) as record:
+        fig, payload = get_result_cache().get_or_compute(
+            result_key + ("figure", name) + options, render, size=lambda entry: entry[1]
+        )
+        st.session_state["chart_payloads"][name] = payload
+        st.plotly_chart(fig, use_container_width=True)
+        record["payload_bytes"] = payload
 
-# ===================== CHART 1 — MONTHLY SALES =====================
-st.markdown(f'<div class="chart-title">📅 {tr["monthly_sales"]}</div>', unsafe_allow_html=True)
+# Serialized size of every figure drawn, reported in the sidebar at the end of a
+# full run; charts not drawn on this run drop out of the report
+st.session_state["chart_payloads"] = {}
 
-if 'Date' in df_filtered.columns and 'Total' in df_filtered.columns:
-    df_temp = df_filtered.copy()
-    df_temp['Date'] = pd.to_datetime(df_temp['Date'], errors='coerce')
-    df_temp = df_temp.dropna(subset=['Date', 'Total'])
+# ===================== KPI CALCULATIONS =====================
+def kpi_section(tr, kpis):
+    total_sales = kpis.total_sales if kpis.total_sales is not None else 0
+    total_quantity = kpis.products_sold if kpis.products_sold is not None else 0
+    sales_after_tax = kpis.sales_after_tax
     
-    if not df_temp.empty:
-        # Extract month-year
-        df_temp['Month_Year'] = df_temp['Date'].dt.to_period('M').astype(str)
-        
-        # Group by month
-        monthly_sales = df_temp.groupby('Month_Year')['Total'].sum().reset_index()
-        monthly_sales = monthly_sales.sort_values('Month_Year')
-        
-        fig1 = go.Figure()
-        fig1.add_trace(go.Scatter(
-            x=monthly_sales['Month_Year'],
-            y=monthly_sales['Total'],
-            mode='lines+markers',
-            line=dict(color=LINE_COLOR, width=3),
-            marker=dict(size=6),
-            fill='tozeroy',
-            fillcolor='rgba(255, 0, 51, 0.1)',
-            name='Total Sales'
-        ))
-        
-        fig1.update_layout(
-            xaxis_title='Month',
-            yaxis_title='Total Sales ($)',
-            template='plotly_white',
-            hovermode='x unified',
-            margin=dict(t=30, b=20, l=40, r=20),
-            plot_bgcolor='rgba(240, 240, 240, 0.1)'
+    # ===================== KPI DISPLAY IN BOXES =====================
+    st.markdown("## 📊 " + tr["data_overview"])
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.markdown(
+            f"""
+            <div class="kpi-box">
+                <div class="kpi-label">{tr["kpi_total_sales"]}</div>
+                <div class="kpi-value">${total_sales:,.2f}</div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+    
+    with col2:
+        st.markdown(
+            f"""
+            <div class="kpi-box">
+                <div class="kpi-label">{tr["kpi_products_sold"]}</div>
+                <div class="kpi-value">{total_quantity:,.0f}</div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+    
+    with col3:
+        sales_after_tax_display = f"${sales_after_tax:,.2f}" if sales_after_tax is not None else "N/A"
+        st.markdown(
+            f"""
+            <div class="kpi-box">
+                <div class="kpi-label">{tr["kpi_sales_after_tax"]}</div>
+                <div class="kpi-value">{sales_after_tax_display}</div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+    
+    with col4:
+        rating_display = f"{kpis.average_rating:.1f}" if kpis.average_rating is not None else "N/A"
+        st.markdown(
+            f"""
+            <div class="kpi-box">
+                <div class="kpi-label">{tr["kpi_rating_avg"]}</div>
+                <div class="kpi-value">{rating_display}</div>
+            </div>
+            """,
+            unsafe_allow_html=True
         )
-        
-        st.plotly_chart(fig1, use_container_width=True)
-    else:
-        st.warning("No date data available for chart")
-else:
-    st.warning("Date or Total columns not found for monthly sales chart")
 
-# ===================== PRODUCT CHARTS =====================
-colA, colB = st.columns(2)
+with stage("KPIs"):
+    kpi_section(tr, compute_kpis(aggregates, data_columns))
 
-with colA:
-    st.markdown(f'<div class="chart-title">📦 {tr["products_sold"]}</div>', unsafe_allow_html=True)
-    
-    if 'Product line' in df_filtered.columns and 'Quantity' in df_filtered.columns:
-        product_qty = df_filtered.groupby('Product line')['Quantity'].sum().reset_index()
-        product_qty = product_qty.sort_values('Quantity', ascending=False)
-        
-        fig2 = px.bar(
-            product_qty.head(10),
-            x='Product line',
-            y='Quantity',
-            labels={'Product line': 'Product Category', 'Quantity': 'Units Sold'},
-            color='Quantity',
-            color_continuous_scale=['lightblue', PRIMARY_START]
+# ===================== CHART 1 — SALES TREND =====================
+@profiled_fragment("Sales trend")
+def sales_trend_section(tr, data_columns, result_key, aggregates):
+    title_slot = st.empty()
+    granularity_col, budget_col = st.columns([3, 1])
+    with granularity_col:
+        granularity = st.selectbox(
+            "🕒 Trend granularity",
+            GRANULARITIES,
+            index=GRANULARITIES.index(DEFAULT_GRANULARITY)
         )
-        
-        fig2.update_layout(
-            template='plotly_white',
-            showlegend=False,
-            xaxis_tickangle=-45,
-            plot_bgcolor='rgba(240, 240, 240, 0.1)'
+    with budget_col:
+        point_budget = st.number_input(
+            "Max points per line",
+            min_value=100,
+            max_value=20_000,
+            value=DEFAULT_POINT_BUDGET,
+            step=100,
+            help="Longer series are downsampled (LTTB) before they are sent to the browser"
+        )
+    trend_title = tr["monthly_sales"] if granularity == 'Month' else f'{tr["sales_trend"]} ({granularity})'
+    title_slot.markdown(f'<div class="chart-title">📅 {trend_title}</div>', unsafe_allow_html=True)
+    
+    if 'Date' in data_columns and 'Total' in data_columns:
+        # Rolled up from the per-day totals of the filtered cube, so switching
+        # granularity only re-aggregates days
+        sales_trend = chart_data(
+            result_key, aggregates, ('sales_trend', granularity),
+            lambda results: sales_trend_data(results, granularity)
         )
         
-        st.plotly_chart(fig2, use_container_width=True)
+        if not sales_trend.empty:
+            def build():
+                trend = downsample_line(sales_trend, PERIOD, 'Total', point_budget)
+                trace = go.Scattergl if len(trend) > WEBGL_THRESHOLD else go.Scatter
+                fig1 = go.Figure()
+                fig1.add_trace(trace(
+                    x=trend['Label'],
+                    y=trend['Total'],
+                    mode='lines+markers',
+                    line=dict(color=LINE_COLOR, width=3),
+                    marker=dict(size=6),
+                    fill='tozeroy',
+                    fillcolor='rgba(255, 0, 51, 0.1)',
+                    name='Total Sales'
+                ))
+                
+                fig1.update_layout(
+                    xaxis_title=granularity,
+                    yaxis_title='Total Sales ($)',
+                    template='plotly_white',
+                    hovermode='x unified',
+                    margin=dict(t=30, b=20, l=40, r=20),
+                    plot_bgcolor='rgba(240, 240, 240, 0.1)'
+                )
+                return fig1
+            
+            show_chart(result_key, 'Sales trend', (granularity, point_budget), build)
+        else:
+            st.warning("No date data available for chart")
     else:
-        st.warning("Product line or Quantity data not available")
+        st.warning("Date or Total columns not found for sales trend chart")
+
+sales_trend_section(tr, data_columns, result_key, aggregates)
 
-with colB:
-    st.markdown(f'<div class="chart-title">📊 {tr["sales_by_product"]}</div>', unsafe_allow_html=True)
+# ===================== PRODUCT CHARTS =====================
+@profiled_fragment("Category charts")
+def category_charts_section(tr, data_columns, result_key, aggregates):
+    top_n = st.slider(
+        "Bars before \"Other\"",
+        min_value=3,
+        max_value=30,
+        value=DEFAULT_TOP_N,
+        help="Smaller categories are summed into one \"Other\" bar"
+    )
+    
+    colA, colB = st.columns(2)
     
-    if 'Product line' in df_filtered.columns and 'Total' in df_filtered.columns:
-        product_sales = df_filtered.groupby('Product line')['Total'].sum().reset_index()
-        product_sales = product_sales.sort_values('Total', ascending=False)
+    with colA:
+        st.markdown(f'<div class="chart-title">📦 {tr["products_sold"]}</div>', unsafe_allow_html=True)
         
-        fig3 = px.bar(
-            product_sales.head(10),
-            x='Product line',
-            y='Total',
-            labels={'Product line': 'Product Category', 'Total': 'Total Sales ($)'},
-            color='Total',
-            color_continuous_scale=['lightcoral', LINE_COLOR]
-        )
+        if 'Product line' in data_columns and 'Quantity' in data_columns:
+            product_qty = chart_data(result_key, aggregates, 'product_qty', product_qty_data)
+            
+            def build():
+                fig2 = px.bar(
+                    top_n_with_other(product_qty, 'Product line', 'Quantity', top_n),
+                    x='Product line',
+                    y='Quantity',
+                    labels={'Product line': 'Product Category', 'Quantity': 'Units Sold'},
+                    color='Quantity',
+                    color_continuous_scale=['lightblue', PRIMARY_START]
+                )
+                
+                fig2.update_layout(
+                    template='plotly_white',
+                    showlegend=False,
+                    xaxis_tickangle=-45,
+                    plot_bgcolor='rgba(240, 240, 240, 0.1)'
+                )
+                return fig2
+            
+            show_chart(result_key, 'Products sold', (top_n,), build)
+        else:
+            st.warning("Product line or Quantity data not available")
+    
+    with colB:
+        st.markdown(f'<div class="chart-title">📊 {tr["sales_by_product"]}</div>', unsafe_allow_html=True)
         
-        fig3.update_layout(
-            template='plotly_white',
-            showlegend=False,
-            xaxis_tickangle=-45,
-            plot_bgcolor='rgba(240, 240, 240, 0.1)'
-        )
+        if 'Product line' in data_columns and 'Total' in data_columns:
+            product_sales = chart_data(result_key, aggregates, 'product_sales', product_sales_data)
+            
+            def build():
+                fig3 = px.bar(
+                    top_n_with_other(product_sales, 'Product line', 'Total', top_n),
+                    x='Product line',
+                    y='Total',
+                    labels={'Product line': 'Product Category', 'Total': 'Total Sales ($)'},
+                    color='Total',
+                    color_continuous_scale=['lightcoral', LINE_COLOR]
+                )
+                
+                fig3.update_layout(
+                    template='plotly_white',
+                    showlegend=False,
+                    xaxis_tickangle=-45,
+                    plot_bgcolor='rgba(240, 240, 240, 0.1)'
+                )
+                return fig3
+            
+            show_chart(result_key, 'Sales by product', (top_n,), build)
+        else:
+            st.warning("Product line or Total data not available")
+    
+    # ===================== PAYMENT AND RATING CHARTS =====================
+    colC, colD = st.columns(2)
+    
+    with colC:
+        st.markdown(f'<div class="chart-title">💳 {tr["payment_methods"]}</div>', unsafe_allow_html=True)
         
-        st.plotly_chart(fig3, use_container_width=True)
-    else:
-        st.warning("Product line or Total data not available")
+        if 'Payment' in data_columns:
+            payment_counts = chart_data(result_key, aggregates, 'payment_counts', payment_counts_data)
+            
+            def build():
+                top_payments = top_n_with_other(payment_counts, 'Payment Method', 'Count', top_n)
+                fig4 = px.pie(
+                    top_payments,
+                    names='Payment Method',
+                    values='Count',
+                    hole=0.4,
+                    color_discrete_sequence=px.colors.sequential.RdBu
+                )
+                
+                fig4.update_traces(
+                    textposition='inside',
+                    textinfo='percent+label',
+                    pull=[0.05] * len(top_payments)
+                )
+                return fig4
+            
+            show_chart(result_key, 'Payment methods', (top_n,), build)
+        else:
+            st.warning("Payment method data not available")
+    
+    with colD:
+        st.markdown(f'<div class="chart-title">⭐ {tr["rating_by_city"]}</div>', unsafe_allow_html=True)
+        
+        if 'City' in data_columns and 'Rating' in data_columns:
+            city_rating = chart_data(result_key, aggregates, 'city_rating', city_rating_data)
+            
+            def build():
+                # Averages cannot be summed into an "Other" bar, so only the top cities are drawn
+                fig5 = px.bar(
+                    city_rating.head(top_n),
+                    x='City',
+                    y='Rating',
+                    labels={'City': 'City', 'Rating': 'Average Rating'},
+                    color='Rating',
+                    color_continuous_scale=['yellow', 'green']
+                )
+                
+                fig5.update_layout(
+                    template='plotly_white',
+                    showlegend=False,
+                    yaxis_range=[0, 10],
+                    plot_bgcolor='rgba(240, 240, 240, 0.1)'
+                )
+                return fig5
+            
+            show_chart(result_key, 'Rating by city', (top_n,), build)
+        else:
+            st.warning("City or Rating data not available")
 
-# ===================== PAYMENT AND RATING CHARTS =====================
-colC, colD = st.columns(2)
+category_charts_section(tr, data_columns, result_key, aggregates)
 
-with colC:
-    st.markdown(f'<div class="chart-title">💳 {tr["payment_methods"]}</div>', unsafe_allow_html=True)
+# ===================== DATA TABLE + DOWNLOAD =====================
+@profiled_fragment("Raw data")
+def raw_data_section(tr, data_key, result_key, filter_widgets, data_columns, cube, df, date_index,
+                     files, file_keys, out_of_core, streaming, all_sheets):
+    st.markdown("---")
+    st.markdown(f"## 📋 {tr['data_overview']}")
     
-    if 'Payment' in df_filtered.columns:
-        payment_counts = df_filtered['Payment'].value_counts().reset_index()
-        payment_counts.columns = ['Payment Method', 'Count']
-        
-        fig4 = px.pie(
-            payment_counts,
-            names='Payment Method',
-            values='Count',
-            hole=0.4,
-            color_discrete_sequence=px.colors.sequential.RdBu
-        )
+    # A toggle rather than an expander: expander bodies run even when collapsed
+    if not st.toggle(tr["view_raw"], value=False):
+        return
+    
+    if out_of_core:
+        # Rows stay in the dataset store: the filters become a scan predicate, the
+        # row count comes from the cube and only the requested page is read
+        show_all_columns = False
+        dataset = get_dataset_store().dataset(file_keys)
+        expression = filter_expression(filter_widgets, data_columns)
+        n_visible = int(slice_cube(cube, filter_widgets)[ROWS].sum())
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
+        n_pages = page_count(n_visible, page_size)
+        page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1)
+        first_row = (page - 1) * page_size
+        with stage("raw data page") as record:
+            page_rows = page_frame(dataset, expression, data_columns, first_row, page_size)
+            record["rows_out"] = len(page_rows)
         
-        fig4.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            pull=[0.05] * len(payment_counts)
+        st.dataframe(page_rows, use_container_width=True)
+        st.caption(
+            f"Rows {min(first_row + 1, n_visible):,}–{first_row + len(page_rows):,} of {n_visible:,} "
+            "· file order (search and sorting need the in-memory mode)"
         )
         
-        st.plotly_chart(fig4, use_container_width=True)
+        def export_rows(fmt, dataset=dataset, expression=expression, columns=data_columns):
+            return export_frames(scan_frames(dataset, expression, columns), fmt)
     else:
-        st.warning("Payment method data not available")
-
-with colD:
-    st.markdown(f'<div class="chart-title">⭐ {tr["rating_by_city"]}</div>', unsafe_allow_html=True)
-    
-    if 'City' in df_filtered.columns and 'Rating' in df_filtered.columns:
-        city_rating = df_filtered.groupby('City')['Rating'].mean().reset_index()
-        city_rating = city_rating.sort_values('Rating', ascending=False)
+        # Per-session evaluator: categorical filters are ORed/ANDed as memoized bitmaps,
+        # the date range is a binary-search slice of the date index
+        if st.session_state.get("filter_data_key") != data_key:
+            st.session_state["filter_data_key"] = data_key
+            st.session_state["incremental_filter"] = IncrementalFilter(
+                load_bitmap_index(data_key, df), date_index
+            )
+        with stage("row filter", rows_in=len(df)) as record:
+            row_mask = st.session_state["incremental_filter"].mask(filter_widgets)
+            record["rows_out"] = int(row_mask.sum())
         
-        fig5 = px.bar(
-            city_rating,
-            x='City',
-            y='Rating',
-            labels={'City': 'City', 'Rating': 'Average Rating'},
-            color='Rating',
-            color_continuous_scale=['yellow', 'green']
-        )
+        # Columns no chart uses are only loaded when asked for
+        show_all_columns = not streaming and st.toggle("Show all workbook columns", value=False)
+        raw_source = load_full_data(files, all_sheets) if show_all_columns else df
+        source_key = (data_key, show_all_columns)
         
-        fig5.update_layout(
-            template='plotly_white',
-            showlegend=False,
-            yaxis_range=[0, 10],
-            plot_bgcolor='rgba(240, 240, 240, 0.1)'
-        )
+        # Search, sort and paging run here on the server; only the visible window of
+        # rows is serialized and sent to the browser
+        search_col, sort_col, direction_col, size_col = st.columns([3, 2, 1, 1])
+        with search_col:
+            search_text = st.text_input("🔎 Search", "").strip()
+        with sort_col:
+            sort_column = st.selectbox("Sort by", ["(file order)"] + list(raw_source.columns))
+        with direction_col:
+            sort_direction = st.selectbox("Order", ["↑", "↓"])
+        with size_col:
+            page_size = st.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE))
         
-        st.plotly_chart(fig5, use_container_width=True)
-    else:
-        st.warning("City or Rating data not available")
-
-# ===================== DATA TABLE + DOWNLOAD =====================
-st.markdown("---")
-st.markdown(f"## 📋 {tr['data_overview']}")
-
-with st.expander(tr["view_raw"], expanded=False):
-    st.dataframe(df_filtered, use_container_width=True)
+        visible_mask = row_mask
+        if search_text:
+            search_memo = st.session_state.get("search_memo")
+            if search_memo is None or search_memo[0] != (source_key, search_text):
+                search_memo = ((source_key, search_text), search_mask(raw_source, search_text))
+                st.session_state["search_memo"] = search_memo
+            visible_mask = row_mask & search_memo[1]
+        
+        order = None
+        if sort_column != "(file order)":
+            order = load_sort_order(source_key, sort_column, sort_direction == "↑", raw_source)
+        positions = visible_positions(visible_mask, order)
+        
+        n_pages = page_count(len(positions), page_size)
+        page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1, step=1)
+        window = page_window(positions, page, page_size)
+        
+        st.dataframe(raw_source.iloc[window], use_container_width=True)
+        first_row = (page - 1) * page_size
+        st.caption(f"Rows {min(first_row + 1, len(positions)):,}–{first_row + len(window):,} of {len(positions):,}")
+        
+        def export_rows(fmt, source=raw_source, mask=row_mask):
+            return export_bytes(source[mask], fmt)
+    
+    # Add download button; the file is only built when the button is clicked
+    # (on a separate thread) and is cached per dataset, filters and format
+    export_format = st.selectbox("Export format", list(EXPORT_FORMATS), index=0)
+    export_ext, export_mime = EXPORT_FORMATS[export_format]
+    export_key = result_key + ("export", show_all_columns, export_format)
+    
+    def build_export(export_rows=export_rows, fmt=export_format, key=export_key,
+                     history=st.session_state["profile_history"], session=profile_session,
+                     trace_memory=st.session_state["profile"].trace_memory):
+        # Runs on the download thread, outside any script run, so it is profiled on its own
+        profile = RunProfile("Export", trace_memory, session)
+        with profile.stage(f"export {fmt}") as record:
+            data = get_export_cache().get_or_compute(key, lambda: export_rows(fmt))
+            record["output_bytes"] = len(data)
+        finish_profile(profile, history)
+        return data
     
-    # Add download button
-    csv = df_filtered.to_csv(index=False).encode('utf-8')
     st.download_button(
-        label=tr["download_csv"],
-        data=csv,
-        file_name="supermarket_sales_filtered.csv",
-        mime="text/csv"
+        label=tr["download_csv"].replace("CSV", export_format),
+        data=build_export,
+        file_name=f"supermarket_sales_filtered.{export_ext}",
+        mime=export_mime,
+        on_click="ignore"
     )
 
-# ===================== BUSINESS INSIGHTS =====================
-st.markdown("---")
-st.markdown(f"## 💡 {tr['business_insights']}")
-
-insight_col1, insight_col2, insight_col3 = st.columns(3)
+raw_data_section(
+    tr, data_key, result_key, filter_widgets, data_columns, cube, df, date_index,
+    files, file_keys, out_of_core, streaming, all_sheets
+)
 
-# Insight 1: Top performing product
-if 'Product line' in df_filtered.columns and 'Total' in df_filtered.columns:
-    top_product = df_filtered.groupby('Product line')['Total'].sum().idxmax()
-    top_product_sales = df_filtered.groupby('Product line')['Total'].sum().max()
+# ===================== BUSINESS INSIGHTS =====================
+def insights_section(tr, insights):
+    st.markdown("---")
+    st.markdown(f"## 💡 {tr['business_insights']}")
     
-    with insight_col1:
-        st.info(f"Top Product Category: {top_product}  \n"
-                f"Sales: ${top_product_sales:,.2f}")
-
-# Insight 2: Best performing city
-if 'City' in df_filtered.columns and 'Total' in df_filtered.columns:
-    top_city = df_filtered.groupby('City')['Total'].sum().idxmax()
-    top_city_sales = df_filtered.groupby('City')['Total'].sum().max()
+    insight_col1, insight_col2, insight_col3 = st.columns(3)
     
-    with insight_col2:
-        st.success(f"Best Performing City: {top_city}  \n"
-                  f"Sales: ${top_city_sales:,.2f}")
-
-# Insight 3: Customer type analysis
-if 'Customer type' in df_filtered.columns and 'Total' in df_filtered.columns:
-    customer_avg = df_filtered.groupby('Customer type')['Total'].mean()
-    best_customer_type = customer_avg.idxmax()
-    avg_sale = customer_avg.max()
+    # Insight 1: Top performing product
+    if insights.top_product is not None:
+        with insight_col1:
+            st.info(f"Top Product Category: {insights.top_product}  \n"
+                    f"Sales: ${insights.top_product_sales:,.2f}")
+    
+    # Insight 2: Best performing city
+    if insights.top_city is not None:
+        with insight_col2:
+            st.success(f"Best Performing City: {insights.top_city}  \n"
+                      f"Sales: ${insights.top_city_sales:,.2f}")
     
-    with insight_col3:
-        st.warning(f"Highest Average Sale: {best_customer_type} customers  \n"
-                  f"Average: ${avg_sale:,.2f}")
+    # Insight 3: Customer type analysis
+    if insights.best_customer_type is not None:
+        with insight_col3:
+            st.warning(f"Highest Average Sale: {insights.best_customer_type} customers  \n"
+                      f"Average: ${insights.best_customer_average:,.2f}")
+
+with stage("insights"):
+    insights_section(tr, compute_insights(aggregates, data_columns))
+
+# ===================== RESULT CACHE STATS =====================
+result_stats = result_cache.stats()
+result_stats_slot.caption(
+    f"🧮 Result cache: {result_stats['hits']} hits / {result_stats['misses']} misses "
+    f"({result_stats['hit_rate']:.0%}) · {result_stats['entries']} entries · "
+    f"{result_stats['bytes'] / 1024 ** 2:,.2f} / {result_stats['max_bytes'] / 1024 ** 2:,.0f} MB"
+)
+
+# ===================== CHART PAYLOADS =====================
+# Fragments cannot write to the sidebar, so a chart option change shows up here on
+# the next full run
+chart_payloads = st.session_state["chart_payloads"]
+if chart_payloads:
+    payload_slot.caption(
+        f"📦 Chart payloads: {sum(chart_payloads.values()) / 1024:,.1f} KB  \n"
+        + "  \n".join(f"{name}: {size / 1024:,.1f} KB" for name, size in chart_payloads.items())
+    )
 
 # ===================== FOOTER =====================
 st.markdown("---")
@@ -809,4 +1521,13 @@ st.markdown(
     </div>
     """,
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+# ===================== PERFORMANCE =====================
+run_summary = finish_profile(st.session_state["profile"], profile_history)
+if show_performance:
+    with performance_panel:
+        st.caption(f"⏱ This run: {run_summary['seconds'] * 1000:,.0f} ms")
+        st.dataframe(stages_frame(run_summary), hide_index=True)
+        st.caption(f"Last {len(profile_history)} runs (fragment reruns included)")
+        st.dataframe(history_frame(profile_history), hide_index=True)
\ No newline at end of file
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# ===================== SETTINGS =====================
+PAGE_SIZES = [100, 500, 1000, 5000]
+DEFAULT_PAGE_SIZE = 500
+
+
+# ===================== SORTING =====================
+def sort_order(df, column, ascending=True):
+    # Positions of every row of the frame ordered by `column`, missing values last.
+    # Built once per (dataset, column, direction) and reused for any filter state.
+    values = df[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+
+# ===================== SEARCH =====================
+def search_mask(df, text):
+    # Case-insensitive substring match against any column. Categorical columns
+    # only scan their categories and map the hits back through the codes.
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            hits = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+            mask |= np.isin(values.cat.codes.to_numpy(), np.flatnonzero(hits))
+        else:
+            matches = values.astype('string').str.contains(text, case=False, regex=False, na=False)
+            mask |= matches.to_numpy(dtype=bool)
+    return mask
+
+
+# ===================== WINDOWING =====================
+def visible_positions(row_mask, order=None):
+    if order is None:
+        return np.flatnonzero(row_mask)
+    return order[row_mask[order]]
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def page_window(positions, page, page_size):
+    start = (page - 1) * page_size
+    return positions[start:start + page_size]